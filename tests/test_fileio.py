@@ -0,0 +1,82 @@
+import os
+import shutil
+import zipfile
+
+import pytest
+
+import utils.omf as omf
+from utils.omf import fileio
+
+TEST_FILE = "assets/v2/test_file.omf"
+
+
+@pytest.fixture
+def omf_file(tmp_path):
+    filename = str(tmp_path / "test_file.omf")
+    shutil.copyfile(TEST_FILE, filename)
+    return filename
+
+
+@pytest.mark.parametrize(
+    "options", [{"elements": ["vol"]}, {"attributes": ["rand attr"]}, {"include_binary": False}]
+)
+def test_update_refuses_partially_loaded_project(omf_file, options):
+    with open(omf_file, "rb") as f:
+        before = f.read()
+    project = omf.load(omf_file, **options)
+    with pytest.raises(ValueError):
+        omf.update(project, omf_file)
+    with open(omf_file, "rb") as f:
+        assert f.read() == before
+    assert len(omf.load(omf_file).elements) == 5
+
+
+def test_update_keeps_untouched_members(omf_file):
+    project = omf.load(omf_file)
+    project.elements[0].name = "renamed"
+    omf.update(project, omf_file)
+    updated = omf.load(omf_file)
+    assert [element.name for element in updated.elements][:2] == ["renamed", "Random Line"]
+    assert len(updated.elements[0].attributes) == 2
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_stored_members_aligned_with_zip64_headers(tmp_path, monkeypatch, stream):
+    # every member past this size gets a zip64 extra field in its local header
+    monkeypatch.setattr(zipfile, "ZIP64_LIMIT", 1000)
+    filename = omf.save(omf.load(TEST_FILE), str(tmp_path / "stored.omf"), compression=zipfile.ZIP_STORED, stream=stream)
+    with zipfile.ZipFile(filename) as zip_file:
+        large = [info for info in zip_file.infolist() if info.file_size > 1000 and info.filename != "project.json"]
+        assert large
+        for info in large:
+            assert fileio._data_offset(zip_file, info) % fileio.ALIGNMENT == 0
+    project = omf.load(filename, mmap=True)
+    assert project.elements[4].attributes[0].array.array.shape == (3000,)
+
+
+def _open_files(filename):
+    fd_dir = "/proc/self/fd"
+    return [fd for fd in os.listdir(fd_dir) if os.path.realpath(os.path.join(fd_dir, fd)) == os.path.realpath(filename)]
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc")
+def test_lazy_project_closes_its_file(omf_file):
+    with omf.load(omf_file, lazy=True) as project:
+        assert project.elements[0].vertices.array.shape == (100, 3)
+        assert _open_files(omf_file)
+    assert not _open_files(omf_file)
+    # arrays not read yet reopen the file
+    assert project.elements[1].vertices.array.shape == (100, 3)
+    project.close()
+    assert not _open_files(omf_file)
+
+
+def test_update_and_compact_release_lazy_projects(omf_file):
+    project = omf.load(omf_file, lazy=True)
+    assert project.elements[0].vertices.array.shape == (100, 3)
+    project.elements[0].name = "renamed"
+    omf.update(project, omf_file)
+    omf.compact(omf_file)
+    assert project.elements[4].attributes[0].array.array.shape == (3000,)
+    project.close()
+    assert omf.load(omf_file).elements[0].name == "renamed"
@@ -0,0 +1,28 @@
+import numpy as np
+
+from utils.pygltf import tools
+
+VERTEX_DTYPE = np.dtype([("position", "<f4", (3,)), ("color", "<f4", (4,)), ("_CU_PCT", "<f4")])
+
+
+def test_weld_tolerance_only_snaps_positions():
+    vertices = np.zeros(4, dtype=VERTEX_DTYPE)
+    vertices["position"] = [[0, 0, 0], [0.1, 0, 0], [0, 0.1, 0], [0.1, 0.1, 0]]
+    vertices["color"] = [[1, 0.5, 0, 1], [1, 1, 0, 1], [1, 0.5, 0, 1], [1, 0.5, 0, 1]]
+    vertices["_CU_PCT"] = [2.41, 2.41, 2.44, 2.41]
+
+    welded, indices = tools.weld_vertices(vertices, np.arange(4), tolerance=1.0)
+
+    # only the first and last vertex share color and grade, the others keep their own values
+    assert len(welded) == 3
+    assert indices.tolist() == [0, 1, 2, 0]
+    np.testing.assert_array_equal(welded["color"], vertices["color"][:3])
+    np.testing.assert_array_equal(welded["_CU_PCT"], vertices["_CU_PCT"][:3])
+
+
+def test_weld_without_tolerance_merges_identical_vertices():
+    vertices = np.zeros(3, dtype=VERTEX_DTYPE)
+    vertices["position"] = [[0, 0, 0], [1, 0, 0], [0, 0, 0]]
+    welded, indices = tools.weld_vertices(vertices, np.array([0, 1, 2]))
+    assert len(welded) == 2
+    assert indices.tolist() == [0, 1, 0]
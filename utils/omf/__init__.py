@@ -23,7 +23,7 @@ from .pointset import PointSet
 from .surface import Surface, TensorGridSurface
 from .texture import ProjectedTexture, UVMappedTexture
 
-from .fileio import load, save, __version__
+from .fileio import compact, load, save, update, __version__
 
 __author__ = "Global Mining Guidelines Group"
 __license__ = "MIT License"
@@ -6,6 +6,8 @@ import numpy as np
 import properties
 
 from .base import BaseModel, ContentModel, ProjectElementAttribute
+from .lazy import LazyModel
+from . import filters
 
 
 DATA_TYPE_LOOKUP_TO_NUMPY = {
@@ -24,7 +26,49 @@ DATA_TYPE_LOOKUP_TO_NUMPY = {
 DATA_TYPE_LOOKUP_TO_STRING = {value: key for key, value in DATA_TYPE_LOOKUP_TO_NUMPY.items()}
 
 
-class Array(BaseModel):
+class _NumpyArray(properties.Array):
+    """Array property that keeps numpy arrays, memory-mapped ones included, without a copy"""
+
+    @property
+    def wrapper(self):
+        return np.asarray
+
+    def equal(self, value_a, value_b):
+        # validation compares every array with itself, memory-mapped ones included
+        return value_a is value_b or super().equal(value_a, value_b)
+
+
+class ArrayChunks:
+    """Bytes of a numeric array read chunk by chunk, to write a member never fully in memory
+
+    **source** is a numpy array, memory-mapped or not, read :code:`chunk_bytes`
+    at a time, or a function returning an iterator of numpy arrays which follow
+    each other along the first axis. The function is called again for every
+    pass over the data.
+    """
+
+    chunk_bytes = 2**24
+
+    def __init__(self, source, dtype=None):
+        self.source = source
+        self.dtype = np.dtype(source.dtype if dtype is None else dtype)
+
+    def chunks(self):
+        """Iterator of the uint8 views of the chunks"""
+        if isinstance(self.source, np.ndarray):
+            values = self.source.reshape(-1)
+            step = max(1, self.chunk_bytes // self.dtype.itemsize)
+            chunks = (values[start : start + step] for start in range(0, len(values), step))
+        else:
+            chunks = self.source()
+        for chunk in chunks:
+            yield np.ascontiguousarray(chunk, dtype=self.dtype).reshape(-1).view(np.uint8)
+
+    def read(self):
+        return b"".join(chunk.tobytes() for chunk in self.chunks())
+
+
+class Array(LazyModel, BaseModel):
     """Class to validate and serialize a 1D or 2D numpy array
 
     Data type, size, shape are computed directly from the array.
@@ -36,8 +80,9 @@ class Array(BaseModel):
     """
 
     schema = "org.omf.v2.array.numeric"
+    _binary_property = "array"
 
-    array = properties.Array(
+    array = _NumpyArray(
         "1D or 2D numpy array wrapped by the Array instance",
         shape={("*",), ("*", "*")},
         dtype=(int, float, bool),
@@ -51,13 +96,38 @@ class Array(BaseModel):
             self.array = array
 
     def __len__(self):
+        if not self.is_loaded:
+            return self._metadata["shape"][0]
         return self.array.__len__()
 
     def __getitem__(self, i):
         return self.array.__getitem__(i)
 
+    @classmethod
+    def from_chunks(cls, chunks, shape, dtype):
+        """Array saved chunk by chunk, generated out of core without ever being fully in memory
+
+        **chunks** is a function returning an iterator of numpy arrays of
+        **dtype** which follow each other along the first axis of **shape**.
+        It is called when the array is saved, and again for deduplication or if
+        :code:`.array` is used, which reads the whole array into memory.
+        """
+        dtype = np.dtype(dtype)
+        if dtype not in DATA_TYPE_LOOKUP_TO_STRING or dtype == np.dtype("bool"):
+            raise ValueError("bad dtype: {} - chunked arrays must be numeric".format(dtype))
+        model = cls()
+        model._member = ArrayChunks(chunks, dtype)
+        model._metadata = {
+            "data_type": DATA_TYPE_LOOKUP_TO_STRING[dtype],
+            "shape": list(shape),
+            "size": int(np.prod(shape)) * dtype.itemsize,
+        }
+        return model
+
     @properties.validator
     def _validate_data_type(self):
+        if not self.is_loaded:
+            return True
         if self.array.dtype not in DATA_TYPE_LOOKUP_TO_STRING:
             raise properties.ValidationError(
                 "bad dtype: {} - Array must have dtype in {}".format(
@@ -70,6 +140,8 @@ class Array(BaseModel):
     @properties.StringChoice("Array data type string", choices=list(DATA_TYPE_LOOKUP_TO_NUMPY))
     def data_type(self):
         """Array type descriptor, determined directly from the array"""
+        if not self.is_loaded:
+            return self._metadata["data_type"]
         if self.array is None:
             return None
         return DATA_TYPE_LOOKUP_TO_STRING.get(self.array.dtype, None)
@@ -80,6 +152,8 @@ class Array(BaseModel):
     )
     def shape(self):
         """Array shape, determined directly from the array"""
+        if not self.is_loaded:
+            return list(self._metadata["shape"])
         if self.array is None:
             return None
         return list(self.array.shape)
@@ -87,6 +161,8 @@ class Array(BaseModel):
     @properties.Integer("Size of array in bytes")
     def size(self):
         """Total size of the array in bytes, determined directly from the array"""
+        if not self.is_loaded:
+            return self._metadata["size"]
         if self.array is None:
             return None
         if self.data_type == "BooleanArray":  # pylint: disable=W0143
@@ -94,12 +170,22 @@ class Array(BaseModel):
         return self.array.size * self.array.itemsize
 
     def serialize(self, include_class=True, save_dynamic=False, **kwargs):
+        output = self._serialize_stored(include_class, kwargs)
+        if output is not None:
+            return output
         output = super().serialize(include_class=include_class, save_dynamic=True, **kwargs)
         binary_dict = kwargs.get("binary_dict", None)
         if binary_dict is not None:
             array_uid = str(uuid.uuid4())
-            if self.data_type == "BooleanArray":  # pylint: disable=W0143
+            if not self.is_loaded and isinstance(self._member, ArrayChunks):
+                array_binary = self._member
+            elif self.data_type == "BooleanArray":  # pylint: disable=W0143
                 array_binary = np.packbits(self.array, axis=None).tobytes()
+            elif kwargs.get("filters", False):
+                array_binary, array_filters = filters.encode(self.array)
+                output.update({"filters": array_filters})
+            elif kwargs.get("stream", False):
+                array_binary = ArrayChunks(self.array)
             else:
                 array_binary = self.array.tobytes()
             binary_dict.update({array_uid: array_binary})
@@ -114,18 +200,33 @@ class Array(BaseModel):
         elif any(key not in value for key in ["shape", "data_type", "array"]):
             pass
         elif value["array"] in binary_dict:
-            array_binary = binary_dict[value["array"]]
-            array_dtype = DATA_TYPE_LOOKUP_TO_NUMPY[value["data_type"]]
-            if value["data_type"] == "BooleanArray":
-                int_arr = np.frombuffer(array_binary, dtype="uint8")
-                bit_arr = np.unpackbits(int_arr)[: np.product(value["shape"])]
-                arr = bit_arr.astype(array_dtype)
+            array_cache = kwargs.get("array_cache")
+            if array_cache is None or not isinstance(binary_dict[value["array"]], (bytes, np.ndarray)):
+                return cls._from_binary(binary_dict[value["array"]], value)
+            key = (value["array"], value["data_type"], tuple(value["shape"]))
+            if key in array_cache:
+                # arrays sharing a member share one read-only buffer
+                array_cache[key].flags.writeable = False
             else:
-                arr = np.frombuffer(array_binary, dtype=array_dtype)
-            arr = arr.reshape(value["shape"])
-            return cls(arr)
+                array_cache[key] = cls._decode(binary_dict[value["array"]], value)
+            model = cls(array_cache[key])
+            model._metadata = value
+            return model
         return cls()
 
+    @classmethod
+    def _decode(cls, binary, value):
+        array_dtype = DATA_TYPE_LOOKUP_TO_NUMPY[value["data_type"]]
+        if value["data_type"] == "BooleanArray":
+            int_arr = np.frombuffer(binary, dtype="uint8")
+            bit_arr = np.unpackbits(int_arr)[: np.prod(value["shape"])]
+            arr = bit_arr.astype(array_dtype)
+        elif value.get("filters"):
+            arr = filters.decode(binary, value["filters"], array_dtype, int(np.prod(value["shape"])))
+        else:
+            arr = np.frombuffer(binary, dtype=array_dtype)
+        return arr.reshape(value["shape"])
+
 
 class ArrayInstanceProperty(properties.Instance):
     """Instance property for OMF Array objects
@@ -144,7 +245,7 @@ class ArrayInstanceProperty(properties.Instance):
     def __init__(self, doc, **kwargs):
         if "instance_class" in kwargs:
             raise AttributeError("ArrayInstanceProperty does not allow custom instance_class")
-        self.validator_prop = properties.Array(
+        self.validator_prop = _NumpyArray(
             "",
             shape={("*",), ("*", "*")},
             dtype=(int, float, bool),
@@ -172,8 +273,12 @@ class ArrayInstanceProperty(properties.Instance):
     def validate(self, instance, value):
         self.validator_prop.name = self.name
         value = super().validate(instance, value)
-        if value.array is not None:
-            value.array = self.validator_prop.validate(instance, value.array)
+        # arrays not read yet are trusted to match their serialized shape and data type
+        if value.is_loaded and value.array is not None:
+            array = self.validator_prop.validate(instance, value.array)
+            # assigning the same array again would detach it from the member it was read from
+            if array is not value.array:
+                value.array = array
         return value
 
     @property
@@ -186,7 +291,7 @@ class ArrayInstanceProperty(properties.Instance):
         return info
 
 
-class StringList(BaseModel):
+class StringList(LazyModel, BaseModel):
     """Class to validate and serialize a large list of strings
 
     Data type, size, shape are computed directly from the list.
@@ -198,6 +303,7 @@ class StringList(BaseModel):
     """
 
     schema = "org.omf.v2.array.string"
+    _binary_property = "array"
 
     array = properties.List(
         "List of datetimes or strings",
@@ -212,6 +318,8 @@ class StringList(BaseModel):
             self.array = array
 
     def __len__(self):
+        if not self.is_loaded:
+            return self._metadata["shape"][0]
         return self.array.__len__()
 
     def __getitem__(self, i):
@@ -220,6 +328,8 @@ class StringList(BaseModel):
     @properties.StringChoice("List data type string", choices=["DateTimeArray", "StringArray"])
     def data_type(self):
         """Array type descriptor, determined directly from the array"""
+        if not self.is_loaded:
+            return self._metadata["data_type"]
         if self.array is None:
             return None
         try:
@@ -236,6 +346,8 @@ class StringList(BaseModel):
     )
     def shape(self):
         """Array shape, determined directly from the array"""
+        if not self.is_loaded:
+            return list(self._metadata["shape"])
         if self.array is None:
             return None
         return [len(self.array)]
@@ -243,11 +355,16 @@ class StringList(BaseModel):
     @properties.Integer("Size of string list dumped to JSON in bytes")
     def size(self):
         """Total size of the string list in bytes"""
+        if not self.is_loaded:
+            return self._metadata["size"]
         if self.array is None:
             return None
         return len(json.dumps(self.array))
 
     def serialize(self, include_class=True, save_dynamic=False, **kwargs):
+        output = self._serialize_stored(include_class, kwargs)
+        if output is not None:
+            return output
         output = super().serialize(include_class=include_class, save_dynamic=True, **kwargs)
         binary_dict = kwargs.get("binary_dict", None)
         if binary_dict is not None:
@@ -264,10 +381,13 @@ class StringList(BaseModel):
         elif any(key not in value for key in ["shape", "data_type", "array"]):
             pass
         elif value["array"] in binary_dict:
-            arr = json.loads(binary_dict[value["array"]].decode("utf8"))
-            return cls(arr)
+            return cls._from_binary(binary_dict[value["array"]], value)
         return cls()
 
+    @classmethod
+    def _decode(cls, binary, value):
+        return json.loads(bytes(binary).decode("utf8"))
+
 
 class ContinuousColormap(ContentModel):
     """Color gradient with min/max values, used with NumericAttribute
@@ -254,12 +254,12 @@ class ProjectElement(ContentModel):
                     )
                 )
             valid_length = self.location_length(attr.location)
-            if len(attr.array.array) != valid_length:
+            if len(attr.array) != valid_length:
                 raise properties.ValidationError(
                     "attributes[{index}] length {attrlen} does not match "
                     "{loc} length {meshlen}".format(
                         index=i,
-                        attrlen=len(attr.array.array),
+                        attrlen=len(attr.array),
                         loc=attr.location,
                         meshlen=valid_length,
                     )
@@ -292,3 +292,20 @@ class Project(ContentModel):
         "Origin for all elements in the project relative to the coordinate reference system",
         default=[0.0, 0.0, 0.0],
     )
+
+    # LazyArchive of a project loaded with lazy=True
+    _archive = None
+
+    def close(self):
+        """Close the file a lazily loaded project reads its arrays from
+
+        Arrays not read yet open it again when they are used.
+        """
+        if self._archive is not None:
+            self._archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,17 +1,159 @@
 """fileio.py: OMF Writer and Reader for serializing to and from .omf files"""
+import collections
 import datetime
+import hashlib
+import io
 import json
 import os
+import struct
+import threading
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
+
+from .attribute import ArrayChunks
 from .base import Project
+from .lazy import LazyArchive, LazyMember, close_archives
 from . import compat
 
 __version__ = "2.0.0a0"
 OMF_VERSION = "2.0"
+# data of stored members is padded to this boundary so memory-mapped arrays are aligned
+ALIGNMENT = 64
+# extra field id zipalign uses for padding, readers skip unknown extra fields
+_PADDING_EXTRA_ID = 0xD935
+_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+# extra field ZipFile adds after the others in the local header of zip64 members
+_ZIP64_EXTRA_SIZE = struct.calcsize("<HHQQ")
+
+
+def _padding_extra(offset, filename, zip64=False, alignment=ALIGNMENT):
+    """Extra field that moves the data of a member written at offset to the alignment
+
+    zip64 is whether the local header will also hold the zip64 extra field.
+    """
+    data_offset = offset + _LOCAL_HEADER.size + len(filename.encode("utf-8")) + 4
+    if zip64:
+        data_offset += _ZIP64_EXTRA_SIZE
+    padding = -data_offset % alignment
+    return struct.pack("<HH", _PADDING_EXTRA_ID, padding) + b"\0" * padding
+
+
+def _codec(compression, name, metadata):
+    """(compress_type, compresslevel) of a binary member, see :func:`save`"""
+    if callable(compression):
+        compression = compression(name, metadata)
+    if isinstance(compression, tuple):
+        return compression
+    return compression, None
+
+
+def _binary_members(value, name=""):
+    """(member, owner name, serialized array/image) of every binary member of the project JSON
+
+    The owner name is the element name, followed by "/" and the attribute or
+    texture name for their arrays and images.
+    """
+    if isinstance(value, dict):
+        if value.get("schema", "").startswith(("org.omf.v2.array.", "org.omf.v2.image.")):
+            member = value.get("array", value.get("image"))
+            if isinstance(member, str):
+                yield member, name, value
+            return
+        if "name" in value and value.get("schema") != "org.omf.v2.project":
+            name = f"{name}/{value['name']}" if name else value["name"]
+        for item in value.values():
+            yield from _binary_members(item, name)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _binary_members(item, name)
+
+
+def _compress_member(info, data, compresslevel):
+    """ZipInfo with CRC and sizes set, and the compressed bytes of a member
+
+    The member is written to an in-memory archive so every codec produces
+    exactly the stream ZipFile would, the bytes after its local header are kept.
+    """
+    with io.BytesIO() as buffer:
+        with zipfile.ZipFile(buffer, mode="w", allowZip64=True) as member_zip:
+            member_zip.writestr(info, data, compresslevel=compresslevel)
+        header = _LOCAL_HEADER.unpack_from(buffer.getbuffer(), 0)
+        start = _LOCAL_HEADER.size + header[10] + header[11]
+        return info, buffer.getvalue()[start : start + info.compress_size]
+
+
+def _write_chunks(zip_file, info, chunks, compresslevel):
+    """Write a member from ArrayChunks through ZipFile.open(..., "w"), one chunk in memory at a time
+
+    info.file_size is the expected size, a different number of bytes raises ValueError.
+    """
+    expected = info.file_size
+    info._compresslevel = compresslevel  # pylint: disable=protected-access
+    # the test ZipFile.open makes for a zip64 header, compressed data may be larger than the input
+    zip64 = expected * 1.05 > zipfile.ZIP64_LIMIT
+    if info.compress_type == zipfile.ZIP_STORED:
+        info.extra = _padding_extra(zip_file.fp.tell(), info.filename, zip64)
+    with zip_file.open(info, mode="w", force_zip64=zip64) as member:
+        for chunk in chunks.chunks():
+            member.write(chunk)
+    if info.file_size != expected:
+        raise ValueError(
+            "Array member {} has {} bytes, its shape and data type need {}".format(
+                info.filename, info.file_size, expected
+            )
+        )
+
 
+def _write_compressed(zip_file, info, data):
+    """Append a member compressed beforehand to an archive open for writing
 
-def save(project, filename, mode="x"):
+    Same bookkeeping as ZipFile.open(..., "w") without compressing again.
+    """
+    zip64 = info.file_size > zipfile.ZIP64_LIMIT or info.compress_size > zipfile.ZIP64_LIMIT
+    info.header_offset = zip_file.fp.tell()
+    if info.compress_type == zipfile.ZIP_STORED:
+        info.extra = _padding_extra(info.header_offset, info.filename, zip64)
+    zip_file.fp.write(info.FileHeader(zip64))
+    if info.compress_type == zipfile.ZIP_STORED and zip_file.fp.tell() % ALIGNMENT:
+        raise RuntimeError("Member {} data is not aligned on {} bytes".format(info.filename, ALIGNMENT))
+    zip_file.fp.write(data)
+    zip_file.filelist.append(info)
+    zip_file.NameToInfo[info.filename] = info
+    zip_file.start_dir = zip_file.fp.tell()
+    zip_file._didModify = True  # pylint: disable=protected-access
+
+
+def _deduplicate(serial_dict, binary_dict):
+    """Keep one member per distinct content, references to the others point to it"""
+    by_digest = {}
+    replaced = {}
+    for key, value in list(binary_dict.items()):
+        digest = hashlib.blake2b(digest_size=32)
+        for chunk in value.chunks() if isinstance(value, ArrayChunks) else [value]:
+            digest.update(chunk)
+        digest = digest.digest()
+        if digest in by_digest:
+            replaced[key] = by_digest[digest]
+            del binary_dict[key]
+        else:
+            by_digest[digest] = key
+    for _, _, metadata in _binary_members(serial_dict):
+        field = "array" if "array" in metadata else "image"
+        metadata[field] = replaced.get(metadata[field], metadata[field])
+
+
+def save(
+    project,
+    filename,
+    mode="x",
+    compression=zipfile.ZIP_DEFLATED,
+    workers=1,
+    filters=False,
+    deduplicate=False,
+    stream=False,
+):
     """Serialize a OMF project to a file
 
     The .omf file is a ZIP archive containing the project JSON
@@ -24,6 +166,43 @@ def save(project, filename, mode="x"):
       ".omf" will be appended
     * **mode** - Valid values are "w" or "x" - if file exists, "w" will
       overwrite and "x" will error. Default is "X"
+    * **compression** - ZIP compression of the binary arrays/images: one of
+      zipfile.ZIP_STORED, ZIP_DEFLATED, ZIP_BZIP2 or ZIP_LZMA, a
+      (compression, compresslevel) tuple, or a function of the owner name
+      ("element" or "element/attribute", textures like attributes) and the
+      serialized array/image metadata returning one of those. Default is
+      zipfile.ZIP_DEFLATED.
+      Arrays written with zipfile.ZIP_STORED are aligned and can be
+      memory-mapped, see :func:`omf.load`
+    * **workers** - Number of threads compressing the arrays/images, each
+      one is written to the file as soon as it is compressed. None uses the
+      ThreadPoolExecutor default. Default is 1
+    * **filters** - If True, numeric arrays are delta encoded, bit-packed
+      and/or byte-shuffled before compression (see :mod:`omf.filters`),
+      usually compressing several times better. Only this package reads such
+      arrays back, keep the default, False, for files shared with other OMF
+      readers
+    * **deduplicate** - If True, arrays/images with identical bytes are
+      written once and all their references point to the same member, they
+      are loaded back as one shared read-only array. Default is False
+    * **stream** - If True, numeric arrays are written to their member in
+      chunks straight from their buffer, memory-mapped ones included,
+      instead of being copied to bytes first. Streamed members are
+      compressed in the calling thread. Arrays made with
+      :meth:`omf.attribute.Array.from_chunks` are always streamed. Default
+      is False
+
+    .. code::
+
+        import zipfile
+        import omf
+
+        def codec(name, metadata):
+            if metadata["schema"] == "org.omf.v2.image.png":
+                return zipfile.ZIP_STORED  # already compressed
+            return zipfile.ZIP_DEFLATED, 1
+
+        omf.save(proj, 'my_project.omf', compression=codec, workers=8)
     """
     time_tuple = datetime.datetime.utcnow().timetuple()[:6]
     if mode not in ("w", "x"):
@@ -34,53 +213,228 @@ def save(project, filename, mode="x"):
         raise ValueError("File already exists: {}".format(filename))
     project.validate()
     binary_dict = {}
-    serial_dict = project.serialize(binary_dict=binary_dict, include_class=False)
+    serial_dict = project.serialize(binary_dict=binary_dict, include_class=False, filters=filters, stream=stream)
     serial_dict["version"] = OMF_VERSION
+    if deduplicate:
+        _deduplicate(serial_dict, binary_dict)
     with zipfile.ZipFile(
         file=filename,
         mode="w",
         compression=zipfile.ZIP_DEFLATED,
         allowZip64=True,
     ) as zip_file:
-        serial_info = zipfile.ZipInfo(
-            filename="project.json",
+        _write_project(zip_file, serial_dict, binary_dict, compression, workers, time_tuple)
+    return filename
+
+
+def _write_project(zip_file, serial_dict, binary_dict, compression, workers, time_tuple):
+    """Write project.json and the binary members, see :func:`save` for compression and workers"""
+    serial_info = zipfile.ZipInfo(
+        filename="project.json",
+        date_time=time_tuple,
+    )
+    serial_info.compress_type = zipfile.ZIP_DEFLATED
+    zip_file.writestr(serial_info, json.dumps(serial_dict).encode("utf-8"))
+
+    def compress(item):
+        key, name, metadata = item
+        binary_info = zipfile.ZipInfo(
+            filename="{}".format(key),
             date_time=time_tuple,
         )
-        serial_info.compress_type = zipfile.ZIP_DEFLATED
-        zip_file.writestr(serial_info, json.dumps(serial_dict).encode("utf-8"))
-        for key, value in binary_dict.items():
-            binary_info = zipfile.ZipInfo(
-                filename="{}".format(key),
-                date_time=time_tuple,
-            )
-            binary_info.compress_type = zipfile.ZIP_DEFLATED
-            zip_file.writestr(binary_info, value)
+        binary_info.compress_type, compresslevel = _codec(compression, name, metadata)
+        # the uncompressed bytes are released once compressed
+        return _compress_member(binary_info, binary_dict.pop(key), compresslevel)
+
+    # a deduplicated member is written once, for its first reference
+    members = {}
+    for item in _binary_members(serial_dict):
+        if item[0] in binary_dict:
+            members.setdefault(item[0], item)
+    streamed = [item for item in members.values() if isinstance(binary_dict[item[0]], ArrayChunks)]
+    compressed = [item for item in members.values() if not isinstance(binary_dict[item[0]], ArrayChunks)]
+    # at most two members per thread are compressed ahead of the writer, so the compressed
+    # bytes waiting in memory stay bounded, they are written in order as they finish
+    window = 2 * (workers or min(32, (os.cpu_count() or 1) + 4))
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for item in compressed:
+            if len(pending) >= window:
+                _write_compressed(zip_file, *pending.popleft().result())
+            pending.append(executor.submit(compress, item))
+        while pending:
+            _write_compressed(zip_file, *pending.popleft().result())
+    # chunked arrays are compressed while they are read, in this thread
+    for key, name, metadata in streamed:
+        binary_info = zipfile.ZipInfo(
+            filename="{}".format(key),
+            date_time=time_tuple,
+        )
+        binary_info.compress_type, compresslevel = _codec(compression, name, metadata)
+        binary_info.file_size = metadata["size"]
+        _write_chunks(zip_file, binary_info, binary_dict.pop(key), compresslevel)
+
+
+def _data_offset(zip_file, info):
+    """Offset in the file of the member data, after its local header"""
+    zip_file.fp.seek(info.header_offset)
+    header = _LOCAL_HEADER.unpack(zip_file.fp.read(_LOCAL_HEADER.size))
+    # sizes of the local header name and extra field, they may differ from the central directory
+    return info.header_offset + _LOCAL_HEADER.size + header[10] + header[11]
+
+
+def update(project, filename, compression=zipfile.ZIP_DEFLATED, workers=1, filters=False, stream=False):
+    """Write the changes of a project back into the OMF v2 file it was loaded from
+
+    Arrays/images that were not replaced keep their members, new ones are
+    appended to the archive with a new project JSON and only the ZIP central
+    directory is rewritten. Data of the replaced members and of the previous
+    project JSON stays in the file, unreachable, until :func:`compact`.
+
+    **Inputs:**
+
+    * **project** - Instance of :class:`omf.base.Project` loaded from the file,
+      with elements or attributes added, replaced or removed
+    * **filename** - Name and path of the OMF file
+    * **compression**, **workers**, **filters**, **stream** - Used for the
+      new members, see :func:`save`
+
+    .. code::
+
+        import omf
+        proj = omf.load('my_project.omf', lazy=True)
+        proj.elements[0].attributes.append(new_grades)
+        omf.update(proj, 'my_project.omf')
+
+    Values changed in place in a loaded array are not detected, assign a new
+    array instead. Projects loaded with **elements**, **attributes** or
+    without binary data cannot be updated, the file would lose everything
+    they left out.
+    """
+    time_tuple = datetime.datetime.utcnow().timetuple()[:6]
+    if getattr(project, "_partial", False):
+        raise ValueError("Projects loaded partially cannot update their file, save them instead: {}".format(filename))
+    if not zipfile.is_zipfile(filename):
+        raise ValueError("Only OMF v2 files can be updated: {}".format(filename))
+    project.validate()
+    # lazy projects keep a handle on the file, it is reopened once the update is written
+    close_archives(filename)
+    with zipfile.ZipFile(file=filename, mode="a", allowZip64=True) as zip_file:
+        if json.loads(zip_file.read("project.json").decode("utf-8")).get("version") != OMF_VERSION:
+            raise ValueError("Only OMF v2 files can be updated: {}".format(filename))
+        members = {name for name in zip_file.NameToInfo if name != "project.json"}
+        binary_dict = {}
+        serial_dict = project.serialize(
+            binary_dict=binary_dict, include_class=False, filters=filters, stream=stream, members=members
+        )
+        serial_dict["version"] = OMF_VERSION
+        kept = set(_referenced(serial_dict, members))
+        zip_file.filelist = [info for info in zip_file.filelist if info.filename in kept]
+        zip_file.NameToInfo = {info.filename: info for info in zip_file.filelist}
+        _write_project(zip_file, serial_dict, binary_dict, compression, workers, time_tuple)
+    return filename
+
+
+def compact(filename):
+    """Rewrite an OMF v2 file without the unreachable data :func:`update` leaves behind
+
+    Members are copied without being decompressed.
+    """
+    compact_filename = filename + ".compact"
+    with zipfile.ZipFile(file=filename, mode="r") as source, zipfile.ZipFile(
+        file=compact_filename, mode="w", allowZip64=True
+    ) as target:
+        for info in source.infolist():
+            source.fp.seek(_data_offset(source, info))
+            data = source.fp.read(info.compress_size)
+            copied = zipfile.ZipInfo(filename=info.filename, date_time=info.date_time)
+            copied.compress_type = info.compress_type
+            copied.external_attr = info.external_attr
+            copied.CRC, copied.compress_size, copied.file_size = info.CRC, info.compress_size, info.file_size
+            _write_compressed(target, copied, data)
+    # member offsets change, lazy projects read them again from the compacted file
+    close_archives(filename)
+    os.replace(compact_filename, filename)
     return filename
 
 
 # pylint: disable=too-few-public-methods
 class _Reader(compat.IOMFReader):
-    def __init__(self, filename: str):
+    def __init__(
+        self, filename: str, mmap: bool = False, lazy: bool = False, memory_budget: int = None, workers: int = 1
+    ):
         self._filename = filename
+        self._workers = workers
+        self._mmap = mmap
+        self._file_map = None
+        self._archive = LazyArchive(filename, memory_budget) if lazy else None
+
+    def _member_view(self, zip_file, info):
+        """Read-only memory-mapped bytes of a stored member, None if it is compressed or encrypted"""
+        if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1 or not info.file_size:
+            return None
+        offset = _data_offset(zip_file, info)
+        if self._file_map is None:
+            self._file_map = np.memmap(self._filename, dtype=np.uint8, mode="r")
+        return self._file_map[offset : offset + info.file_size]
+
+    def _read_members(self, zip_file, infos):
+        """{name: bytes} of the members, decompressed by a pool of threads with their own ZIP handles"""
+        if self._workers == 1 or len(infos) < 2:
+            return {info.filename: zip_file.read(info) for info in infos}
+        local = threading.local()
+        handles = []
+        lock = threading.Lock()
 
-    def load(self, include_binary: bool = True, project_json: str = None) -> Project:
-        project_dict = {}
+        def read(info):
+            if not hasattr(local, "zip_file"):
+                local.zip_file = zipfile.ZipFile(file=self._filename, mode="r")
+                with lock:
+                    handles.append(local.zip_file)
+            return local.zip_file.read(info)
+
+        # largest members first so no thread is left with a big one at the end
+        infos = sorted(infos, key=lambda info: info.compress_size, reverse=True)
+        try:
+            with ThreadPoolExecutor(max_workers=self._workers) as executor:
+                return dict(zip((info.filename for info in infos), executor.map(read, infos)))
+        finally:
+            for handle in handles:
+                handle.close()
+
+    def load(
+        self, include_binary: bool = True, project_json: str = None, elements=None, attributes=None
+    ) -> Project:
         binary_dict = {}
-        project_version = None
 
         try:
             with zipfile.ZipFile(file=self._filename, mode="r") as zip_file:
-                for info in zip_file.infolist():
-                    with zip_file.open(info, mode="r") as file:
-                        if info.filename == "project.json":
-                            project_dict = json.load(file)
-                            project_version = project_dict.pop("version")
-                        elif include_binary:
-                            binary_dict[info.filename] = file.read()
+                project_dict = json.loads(zip_file.read("project.json").decode("utf-8"))
+                project_version = project_dict.pop("version", None)
+                if project_version == OMF_VERSION:
+                    if project_json is not None:
+                        project_dict = json.loads(project_json) if isinstance(project_json, str) else project_json
+                    project_dict = _select(project_dict, elements, attributes)
+                if include_binary:
+                    members = {info.filename: info for info in zip_file.infolist()}
+                    to_read = []
+                    # only the members the remaining arrays and images point to are read
+                    for name in _referenced(project_dict, members):
+                        view = self._member_view(zip_file, members[name]) if self._mmap else None
+                        if view is not None:
+                            binary_dict[name] = view
+                        elif self._archive is not None:
+                            binary_dict[name] = LazyMember(self._archive, name)
+                        else:
+                            to_read.append(members[name])
+                    binary_dict.update(self._read_members(zip_file, to_read))
 
         except zipfile.BadZipFile as exc:
             raise compat.WrongVersionError(exc)
 
+        except KeyError as exc:
+            raise compat.InvalidOMFFile(f"Unsupported format: {self._filename}") from exc
+
         except Exception as exc:
             raise compat.InvalidOMFFile(exc)
 
@@ -89,10 +443,100 @@ class _Reader(compat.IOMFReader):
         if project_version != OMF_VERSION:
             raise compat.WrongVersionError(f"Unsupported file version: {project_version}")
 
-        return Project.deserialize(value=project_dict, binary_dict=binary_dict, trusted=True)
+        project = Project.deserialize(value=project_dict, binary_dict=binary_dict, array_cache={}, trusted=True)
+        # update() refuses to write a project missing elements, attributes or arrays of its file
+        project._partial = elements is not None or attributes is not None or not include_binary
+        project._archive = self._archive
+        return project
+
+
+def _selected(element, elements, get):
+    """True if the element name or schema is one of elements, None selects every element"""
+    return elements is None or get(element, "name") in elements or get(element, "schema") in elements
+
+
+def _select(project_dict, elements=None, attributes=None):
+    """Copy of the project JSON with only the selected elements and attributes
+
+    A Composite that is not selected itself keeps its selected children and is
+    dropped when none is left.
+    """
+
+    def select_elements(element_dicts):
+        selected = []
+        for element in element_dicts:
+            if not _selected(element, elements, dict.get):
+                if "elements" not in element:
+                    continue
+                element = dict(element, elements=select_elements(element["elements"]))
+                if not element["elements"]:
+                    continue
+            selected.append(select_attributes(element))
+        return selected
 
+    def select_attributes(element):
+        element = dict(element)
+        if attributes is not None and "attributes" in element:
+            element["attributes"] = [item for item in element["attributes"] if item["name"] in attributes]
+        if "elements" in element:
+            element["elements"] = [select_attributes(child) for child in element["elements"]]
+        return element
 
-def load(filename: str, include_binary: bool = True, project_json: str = None) -> Project:
+    if elements is None and attributes is None:
+        return project_dict
+    return dict(project_dict, elements=select_elements(project_dict.get("elements", [])))
+
+
+def _referenced(value, members):
+    """Names of the ZIP members referenced anywhere in the project JSON"""
+    if isinstance(value, dict):
+        for item in value.values():
+            yield from _referenced(item, members)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _referenced(item, members)
+    elif isinstance(value, str) and value in members and value != "project.json":
+        yield value
+
+
+def _select_project(project, elements=None, attributes=None):
+    """In-place equivalent of _select on a loaded project, for readers of older versions"""
+
+    def select_elements(element_list):
+        selected = []
+        for element in element_list:
+            if not _selected(element, elements, getattr):
+                if not hasattr(element, "elements"):
+                    continue
+                element.elements = select_elements(element.elements)
+                if not element.elements:
+                    continue
+            select_attributes(element)
+            selected.append(element)
+        return selected
+
+    def select_attributes(element):
+        if attributes is not None:
+            element.attributes = [attribute for attribute in element.attributes if attribute.name in attributes]
+        for child in getattr(element, "elements", []):
+            select_attributes(child)
+
+    if elements is not None or attributes is not None:
+        project.elements = select_elements(project.elements)
+    return project
+
+
+def load(
+    filename: str,
+    include_binary: bool = True,
+    project_json: str = None,
+    mmap: bool = False,
+    elements=None,
+    attributes=None,
+    lazy: bool = False,
+    memory_budget: int = None,
+    workers: int = 1,
+) -> Project:
     """Deserialize an OMF file into a project
 
     **Inputs:**
@@ -102,6 +546,25 @@ def load(filename: str, include_binary: bool = True, project_json: str = None) -
       loaded into memory. Default is True
     * **project_json** - Alternative JSON used to construct the output OMF
       project. By default, the project JSON from the OMF file is used.
+    * **mmap** - If True, arrays stored uncompressed in an OMF v2 file are
+      read-only numpy views of a memory map of the file instead of copies in
+      memory, the OS only reads the pages that are used. Compressed members
+      and older file versions are read as usual. Default is False
+    * **elements** - Names or schemas of the elements to load, a Composite
+      keeps its matching children. Default is None, every element
+    * **attributes** - Names of the attributes to load on those elements.
+      Default is None, every attribute
+    * **lazy** - If True, arrays and images of an OMF v2 file are only read
+      when their value is first used, their data type, shape and size are
+      available without reading them. The file stays open until
+      :code:`project.close()`, or use the project in a :code:`with` block.
+      Default is False
+    * **memory_budget** - With lazy, bytes of decoded arrays and images kept
+      in memory, the least recently used ones are released and read again
+      when needed. Default is None, no limit
+    * **workers** - Number of threads decompressing the arrays and images of
+      an OMF v2 file, each with its own handle on the file. None uses the
+      ThreadPoolExecutor default. Default is 1, members are read one by one
 
     The most common use of this function is simply to load an entire OMF
     file:
@@ -117,15 +580,26 @@ def load(filename: str, include_binary: bool = True, project_json: str = None) -
     .. code::
 
         import omf
-        proj_no_bin = omf.load('my_project.omf', include_binary=False)
-        ...  # Mutate proj_no_bin to include only the desired elements/attributes
-        proj = omf.load('my_project.omf', project_json=proj_no_bin.serialize())
+        proj = omf.load('my_project.omf', elements=['vol'], attributes=['CU_pct'])
+
+    Only project.json and the arrays of the selected elements and attributes
+    are read from OMF v2 files, older versions are loaded whole and filtered.
+
+    Projects saved with :code:`compression=zipfile.ZIP_STORED` open almost
+    instantly with :code:`omf.load('my_project.omf', mmap=True)`.
     """
 
     for reader_cls in [_Reader] + compat.compatible_omf_readers:
         try:
+            # only the OMF v2 reader maps arrays, reads them lazily or in parallel
+            if reader_cls is _Reader:
+                reader = reader_cls(filename, mmap=mmap, lazy=lazy, memory_budget=memory_budget, workers=workers)
+                return reader.load(include_binary, project_json, elements=elements, attributes=attributes)
             reader = reader_cls(filename)
-            return reader.load(include_binary=include_binary, project_json=project_json)
+            project = _select_project(reader.load(include_binary=include_binary, project_json=project_json),
+                                      elements, attributes)
+            project._partial = elements is not None or attributes is not None or not include_binary
+            return project
         except compat.WrongVersionError:
             continue
     raise compat.InvalidOMFFile(f"Unsupported file: {filename}")
\ No newline at end of file
@@ -0,0 +1,148 @@
+"""filters.py: reversible pre-filters applied to numeric array bytes before compression
+
+Filtered arrays list their filters, in the order they were applied, under the
+"filters" key of their serialized JSON. Only this package reverses them, files
+meant for other OMF readers are saved without filters.
+"""
+import zlib
+
+import numpy as np
+
+# values bit-packed at once, a multiple of 8 so every chunk ends on a byte
+BITPACK_CHUNK = 2 ** 16
+# values per block and blocks of an array compressed to pick its filters
+SAMPLE_SIZE = 2 ** 14
+SAMPLE_BLOCKS = 4
+
+
+def _bits(values):
+    """Bits needed for the range of integer values"""
+    if not values.size:
+        return 0
+    return (int(values.max()) - int(values.min())).bit_length()
+
+
+def _unsigned(dtype):
+    return np.dtype(f"u{dtype.itemsize}")
+
+
+def delta(values):
+    """Differences of consecutive values, wrapping around like the integer dtype, first one 0"""
+    result = np.zeros_like(values)
+    np.subtract(values[1:], values[:-1], out=result[1:])
+    return result
+
+
+def undelta(values, first):
+    result = np.cumsum(values, dtype=values.dtype)
+    result += np.asarray(first).astype(values.dtype)
+    return result
+
+
+def bitpack(values, bits, offset):
+    """Little-endian packing of values - offset on the given number of bits"""
+    unsigned = _unsigned(values.dtype)
+    shifts = np.arange(bits, dtype=unsigned)
+    offset = np.asarray(offset).astype(values.dtype).view(unsigned)
+    chunks = []
+    for start in range(0, len(values), BITPACK_CHUNK):
+        chunk = values[start : start + BITPACK_CHUNK].view(unsigned) - offset
+        chunk_bits = ((chunk[:, None] >> shifts) & 1).astype(np.uint8)
+        chunks.append(np.packbits(chunk_bits, axis=None, bitorder="little"))
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.uint8)
+
+
+def bitunpack(binary, bits, offset, count, dtype):
+    unsigned = _unsigned(dtype)
+    weights = np.left_shift(np.ones(bits, dtype=unsigned), np.arange(bits, dtype=unsigned))
+    offset = np.asarray(offset).astype(dtype).view(unsigned)
+    result = np.empty(count, dtype=unsigned)
+    for start in range(0, count, BITPACK_CHUNK):
+        stop = min(start + BITPACK_CHUNK, count)
+        chunk = binary[start * bits // 8 : (stop * bits + 7) // 8]
+        chunk_bits = np.unpackbits(chunk, count=(stop - start) * bits, bitorder="little")
+        result[start:stop] = chunk_bits.reshape(-1, bits).astype(unsigned) @ weights
+    result += offset
+    return result.view(dtype)
+
+
+def shuffle(values):
+    """Bytes of the values grouped by significance: first bytes of every value, then second bytes..."""
+    return values.view(np.uint8).reshape(-1, values.dtype.itemsize).T.copy()
+
+
+def unshuffle(binary, dtype):
+    return binary.reshape(dtype.itemsize, -1).T.copy().view(dtype).ravel()
+
+
+def _chain(values, use_delta, use_bitpack, use_shuffle):
+    """Filtered values and filters of one combination of the filters, skipping those that do not apply"""
+    filters = []
+    if use_delta and values.dtype.kind in "iu" and values.size:
+        filters.append({"name": "delta", "first": values[0].item()})
+        values = delta(values)
+    bits = _bits(values) if values.dtype.kind in "iu" else None
+    if use_bitpack and bits is not None and bits < values.dtype.itemsize * 8 and values.size:
+        offset = values.min().item()
+        filters.append({"name": "bitpack", "bits": bits, "offset": offset})
+        # a constant array needs no bytes at all
+        values = bitpack(values, bits, offset) if bits else np.zeros(0, dtype=np.uint8)
+    if use_shuffle and values.dtype.itemsize > 1:
+        filters.append({"name": "shuffle"})
+        values = shuffle(values)
+    return values, filters
+
+
+def _samples(values):
+    """Up to SAMPLE_BLOCKS contiguous blocks of SAMPLE_SIZE values spread over the array"""
+    if len(values) <= SAMPLE_BLOCKS * SAMPLE_SIZE:
+        return [values]
+    starts = np.linspace(0, len(values) - SAMPLE_SIZE, SAMPLE_BLOCKS).astype(np.int64)
+    return [values[start : start + SAMPLE_SIZE] for start in starts]
+
+
+def encode(array):
+    """Filtered bytes of a numeric array and the list of filters applied
+
+    Integer arrays may be delta encoded (sorted or slowly varying indices such
+    as cbc, zoc or triangles) and bit-packed to the bits their range needs,
+    multi-byte values may be byte-shuffled. Each combination is tried on
+    samples of the array and the one deflating smallest is kept, which may be
+    no filter at all: shuffling noisy floats or delta encoding unsorted values
+    makes them compress worse.
+    """
+    values = np.ascontiguousarray(array).ravel()
+    integer = values.dtype.kind in "iu"
+    candidates = [
+        (use_delta, use_bitpack, use_shuffle)
+        for use_delta in ((False, True) if integer else (False,))
+        for use_bitpack in ((False, True) if integer else (False,))
+        for use_shuffle in ((False, True) if values.dtype.itemsize > 1 else (False,))
+    ]
+    samples = _samples(values)
+
+    def compressed_size(candidate):
+        return sum(len(zlib.compress(_chain(sample, *candidate)[0].tobytes(), 1)) for sample in samples)
+
+    best = min(candidates, key=compressed_size)
+    values, filters = _chain(values, *best)
+    return values.tobytes(), filters
+
+
+def decode(binary, filters, dtype, count):
+    """Flat array of count values of dtype from filtered bytes"""
+    values = np.frombuffer(binary, dtype=np.uint8)
+    # a shuffle applied last worked on the values of the dtype, a bit-packed array has none left
+    for item in reversed(filters):
+        if item["name"] == "shuffle":
+            values = unshuffle(values, dtype)
+        elif item["name"] == "bitpack":
+            if item["bits"]:
+                values = bitunpack(values, item["bits"], item["offset"], count, dtype)
+            else:
+                values = np.full(count, item["offset"], dtype=dtype)
+        elif item["name"] == "delta":
+            values = undelta(values.view(dtype), item["first"])
+        else:
+            raise ValueError(f"Unknown array filter: {item['name']}")
+    return values.view(dtype)
@@ -0,0 +1,176 @@
+"""lazy.py: binary members of an OMF archive read on first use"""
+import collections
+import os
+import threading
+import weakref
+import zipfile
+
+# every LazyArchive, so a file can be released before it is rewritten
+_archives = weakref.WeakSet()
+
+
+def close_archives(filename: str):
+    """Close the ZIP handles of every LazyArchive on the file, they reopen it on their next read"""
+    path = os.path.abspath(filename)
+    for archive in list(_archives):
+        if os.path.abspath(archive.filename) == path:
+            archive.close()
+
+
+class LazyArchive:
+    """OMF archive whose binary members are read when a model first uses them
+
+    Decoded values are tracked least recently used first. Once they take more than
+    **memory_budget** bytes the oldest ones are released and read again on their
+    next use. Without a budget every value stays loaded.
+    """
+
+    def __init__(self, filename: str, memory_budget: int = None):
+        self.filename = filename
+        self.memory_budget = memory_budget
+        self.loaded_bytes = 0
+        self._lock = threading.RLock()
+        self._zip_file = None
+        self._loaded = collections.OrderedDict()  # id(model) -> (model, bytes)
+        _archives.add(self)
+
+    def read(self, name: str) -> bytes:
+        """Bytes of a ZIP member"""
+        with self._lock:
+            if self._zip_file is None:
+                self._zip_file = zipfile.ZipFile(file=self.filename, mode="r")
+            return self._zip_file.read(name)
+
+    def close(self):
+        """Close the ZIP file, it is opened again if a member is read"""
+        with self._lock:
+            if self._zip_file is not None:
+                self._zip_file.close()
+                self._zip_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def touch(self, model, nbytes: int):
+        """Mark the model value as most recently used and release the oldest values over budget"""
+        with self._lock:
+            key = id(model)
+            if key in self._loaded:
+                self._loaded.move_to_end(key)
+                return
+            self._loaded[key] = (model, nbytes)
+            self.loaded_bytes += nbytes
+            # the value just used is never released
+            while self.memory_budget is not None and self.loaded_bytes > self.memory_budget and len(self._loaded) > 1:
+                _, (oldest, size) = self._loaded.popitem(last=False)
+                oldest._release()
+                self.loaded_bytes -= size
+
+    def forget(self, model):
+        """Stop tracking a model whose value was replaced"""
+        with self._lock:
+            _, size = self._loaded.pop(id(model), (None, 0))
+            self.loaded_bytes -= size
+
+
+class LazyMember:
+    """Name of a ZIP member of a LazyArchive, placed in binary_dict instead of its bytes"""
+
+    def __init__(self, archive: LazyArchive, name: str):
+        self.archive = archive
+        self.name = name
+
+    def read(self) -> bytes:
+        return self.archive.read(self.name)
+
+
+class LazyModel:
+    """Mixin of the models holding one binary member: Array, StringList and Image
+
+    Models deserialized from a LazyMember keep the member and its serialized
+    metadata and only decode the binary property on first access. Setting the
+    property detaches the model from the archive.
+
+    Every deserialized model remembers its serialized metadata, so a file
+    update can keep the member of a model whose value was not replaced.
+
+    The member may be any object with a read() method returning the bytes,
+    such as :class:`omf.attribute.ArrayChunks`.
+    """
+
+    # name of the property decoded from the member
+    _binary_property = None
+    # key of the member name in the serialized model
+    _member_key = "array"
+    _member = None
+    _metadata = None
+
+    @classmethod
+    def _decode(cls, binary, value):
+        """Value of the binary property from the member bytes and the serialized metadata"""
+        raise NotImplementedError
+
+    @classmethod
+    def _from_binary(cls, binary, value):
+        if isinstance(binary, LazyMember):
+            model = cls()
+            model._member = binary
+        else:
+            model = cls(cls._decode(binary, value))
+        model._metadata = value
+        return model
+
+    def _serialize_stored(self, include_class, kwargs):
+        """Serialized model pointing to the member it was read from
+
+        None unless that member is one of the **members** keyword argument, the
+        names already in the archive being updated.
+        """
+        members = kwargs.get("members")
+        if not members or self._metadata is None or self._metadata.get(self._member_key) not in members:
+            return None
+        output = {key: value for key, value in self._metadata.items() if key != "__class__"}
+        output.update({"schema": self.schema})
+        if include_class:
+            output.update({"__class__": self.__class__.__name__})
+        return output
+
+    @property
+    def is_loaded(self):
+        """False until the binary property of a lazily loaded model is used"""
+        return self._member is None or self._backend.get(self._binary_property) is not None
+
+    def _get(self, name):
+        if name == self._binary_property and self._member is not None:
+            value = self._backend.get(name)
+            # serialization only needs the metadata, the binary is written separately
+            if value is None and getattr(self, "_getting_serialized", False):
+                return None
+            if value is None:
+                binary = self._member.read()
+                value = self._decode(binary, self._metadata)
+                self._backend[name] = value
+                self._nbytes = getattr(value, "nbytes", len(binary))
+            if isinstance(self._member, LazyMember):
+                self._member.archive.touch(self, self._nbytes)
+        return super()._get(name)
+
+    def _set(self, name, value):
+        if name == self._binary_property:
+            if isinstance(self._member, LazyMember):
+                self._member.archive.forget(self)
+            self._member = None
+            self._metadata = None
+        super()._set(name, value)
+
+    def _validate_props(self):
+        # a value not read yet is trusted to match its serialized metadata
+        if not self.is_loaded:
+            return True
+        return super()._validate_props()
+
+    def _release(self):
+        self._backend.pop(self._binary_property, None)
@@ -41,14 +41,14 @@ class LineSet(ProjectElement):
     @property
     def num_nodes(self):
         """Number of nodes (vertices)"""
-        return len(self.vertices.array)
+        return len(self.vertices)
 
     @property
     def num_cells(self):
         """Number of cells (segments)"""
         if self.segments is None:
-            return len(self.vertices.array) - 1
-        return len(self.segments.array)
+            return len(self.vertices) - 1
+        return len(self.segments)
 
     @properties.validator
     def _validate_mesh(self):
@@ -57,6 +57,6 @@ class LineSet(ProjectElement):
             return True
         if np.min(self.segments.array) < 0:
             raise properties.ValidationError("Segments may only have positive integers")
-        if np.max(self.segments.array) >= len(self.vertices.array):
+        if np.max(self.segments.array) >= len(self.vertices):
             raise properties.ValidationError("Segments expects more vertices than provided")
         return True
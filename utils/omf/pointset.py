@@ -30,7 +30,7 @@ class PointSet(ProjectElement, HasTexturesMixin):
     @property
     def num_nodes(self):
         """Number of nodes (vertices)"""
-        return len(self.vertices.array)
+        return len(self.vertices)
 
     @property
     def num_cells(self):
@@ -0,0 +1,234 @@
+"""summary.py: metadata of OMF files read without loading their arrays
+
+Only project.json and the ZIP central directory of OMF v2 files, or the JSON
+tail of OMF v1 files, are read, no properties object is built.
+
+.. code::
+
+    python -m utils.omf.summary my_project.omf other.omf
+    python -m utils.omf.summary --json my_project.omf
+"""
+import argparse
+import json
+import sys
+import zipfile
+
+import numpy as np
+
+from . import compat
+from .compat import omf_v1
+from .fileio import OMF_VERSION
+
+ARRAY_SCHEMAS = ("org.omf.v2.array.", "org.omf.v2.image.")
+# element keys that are not geometry
+NOT_GEOMETRY = ("attributes", "textures", "metadata", "elements")
+
+
+def _box(origin, axes, lengths):
+    """(min, max) corners of a box spanned by the scaled axes from origin"""
+    origin = np.asarray(origin, dtype=np.float64)
+    edges = np.asarray(axes, dtype=np.float64) * np.asarray(lengths, dtype=np.float64)[:, None]
+    corners = origin + np.array([[i, j, k] for i in (0, 1) for j in (0, 1) for k in (0, 1)]) @ edges
+    return corners.min(axis=0).tolist(), corners.max(axis=0).tolist()
+
+
+def _v2_array(value, sizes):
+    """Data type, shape and sizes of a serialized array or image"""
+    member = value.get("array", value.get("image"))
+    compressed, uncompressed = sizes.get(member, (None, None))
+    return {
+        "data_type": value.get("data_type"),
+        "shape": value.get("shape"),
+        "size": value.get("size", uncompressed),
+        "compressed_size": compressed,
+    }
+
+
+def _tensor_lengths(geometry):
+    """Grid lengths along u, v and w from inline tensors, w is 0 for surfaces, None for binary tensors"""
+    tensors = [geometry.get(key) for key in ("tensor_u", "tensor_v", "tensor_w")]
+    if tensors[2] is None and "axis_w" not in geometry:
+        # tensor grid surfaces are flat, offset_w is an array
+        tensors[2] = []
+    if not all(isinstance(tensor, list) for tensor in tensors):
+        return None
+    return [sum(tensor) for tensor in tensors]
+
+
+def _axes(geometry):
+    return [geometry.get(axis, default) for axis, default in zip(("axis_u", "axis_v", "axis_w"), np.eye(3))]
+
+
+def _v2_extent(element):
+    """Extent of grids defined in the JSON, None when it needs array values
+
+    The extent of a tensor grid surface is its flat grid, offset_w is not included.
+    """
+    # same default as the loader, which ignores any other key
+    origin = element.get("origin", [0.0, 0.0, 0.0])
+    if "block_count" in element and "block_size" in element:
+        return _box(origin, _axes(element), np.multiply(element["block_count"], element["block_size"]))
+    if "parent_block_count" in element and "parent_block_size" in element:
+        return _box(origin, _axes(element), np.multiply(element["parent_block_count"], element["parent_block_size"]))
+    if "tensor_u" in element:
+        lengths = _tensor_lengths(element)
+        return None if lengths is None else _box(origin, _axes(element), lengths)
+    return None
+
+
+def _v2_element(element, sizes):
+    summary = {"name": element.get("name"), "schema": element.get("schema"), "extent": _v2_extent(element)}
+    summary["geometry"] = {
+        key: _v2_array(value, sizes)
+        for key, value in element.items()
+        if key not in NOT_GEOMETRY and isinstance(value, dict) and value.get("schema", "").startswith(ARRAY_SCHEMAS)
+    }
+    summary["attributes"] = [
+        dict(
+            name=attribute.get("name"),
+            schema=attribute.get("schema"),
+            location=attribute.get("location"),
+            **_v2_array(attribute.get("array", {}), sizes),
+        )
+        for attribute in element.get("attributes", [])
+    ]
+    summary["textures"] = [
+        dict(name=texture.get("name"), **_v2_array(texture.get("image", {}), sizes))
+        for texture in element.get("textures", [])
+    ]
+    if "elements" in element:
+        summary["elements"] = [_v2_element(child, sizes) for child in element["elements"]]
+    return summary
+
+
+def _summarize_v2(filename):
+    with zipfile.ZipFile(file=filename, mode="r") as zip_file:
+        project = json.loads(zip_file.read("project.json").decode("utf-8"))
+        sizes = {info.filename: (info.compress_size, info.file_size) for info in zip_file.infolist()}
+    version = project.get("version")
+    if version != OMF_VERSION:
+        raise compat.WrongVersionError(f"Unsupported file version: {version}")
+    return {
+        "file": filename,
+        "version": version,
+        "name": project.get("name"),
+        "description": project.get("description"),
+        "elements": [_v2_element(element, sizes) for element in project.get("elements", [])],
+    }
+
+
+def _v1_array(objects, uid):
+    """Data type and compressed size of a v1 array, its shape needs the array itself"""
+    value = objects.get(uid, {}).get("array", objects.get(uid, {}).get("image", {}))
+    if not isinstance(value, dict):
+        return {"data_type": None, "shape": None, "size": None, "compressed_size": None}
+    return {"data_type": value.get("dtype"), "shape": None, "size": None, "compressed_size": value.get("length")}
+
+
+def _v1_element(objects, element):
+    geometry = objects.get(element.get("geometry"), {})
+    summary = {"name": element.get("name"), "schema": element.get("__class__"), "extent": None}
+    lengths = _tensor_lengths(geometry) if "tensor_u" in geometry else None
+    if lengths is not None:
+        summary["extent"] = _box(geometry.get("origin", [0.0, 0.0, 0.0]), _axes(geometry), lengths)
+    summary["geometry"] = {
+        key: _v1_array(objects, value)
+        for key, value in geometry.items()
+        if isinstance(value, str) and isinstance(objects.get(value), dict) and "array" in objects[value]
+    }
+    summary["attributes"] = [
+        dict(
+            name=objects.get(uid, {}).get("name"),
+            schema=objects.get(uid, {}).get("__class__"),
+            location=objects.get(uid, {}).get("location"),
+            **_v1_array(objects, objects.get(uid, {}).get("array")),
+        )
+        for uid in element.get("data", [])
+    ]
+    summary["textures"] = [
+        dict(name=objects.get(uid, {}).get("name"), **_v1_array(objects, uid)) for uid in element.get("textures", [])
+    ]
+    return summary
+
+
+def _summarize_v1(filename):
+    reader = omf_v1.Reader(filename)
+    # pylint: disable=protected-access
+    with open(filename, "rb") as reader._f:
+        project_uuid, json_start = reader._read_header()
+        objects = reader._read_json(json_start)
+    project = objects.get(project_uuid, {})
+    return {
+        "file": filename,
+        "version": omf_v1.COMPATIBILITY_VERSION.decode("utf-8"),
+        "name": project.get("name"),
+        "description": project.get("description"),
+        "elements": [_v1_element(objects, objects.get(uid, {})) for uid in project.get("elements", [])],
+    }
+
+
+def summarize(filename: str) -> dict:
+    """Elements, schemas, attributes, array data types, shapes, sizes and extents of an OMF file
+
+    Values that need the arrays themselves, v1 shapes and the extents of
+    geometry stored in arrays, are None.
+    """
+    for summarize_version in (_summarize_v2, _summarize_v1):
+        try:
+            return summarize_version(filename)
+        except (zipfile.BadZipFile, compat.WrongVersionError):
+            continue
+    raise compat.InvalidOMFFile(f"Unsupported file: {filename}")
+
+
+def _size(value):
+    return "?" if value is None else f"{value:,} B"
+
+
+def _array_line(label, array):
+    shape = "?" if array["shape"] is None else "x".join(str(length) for length in array["shape"])
+    return f"{label}  {array['data_type']}  [{shape}]  {_size(array['size'])} ({_size(array['compressed_size'])} compressed)"
+
+
+def _element_lines(element, indent="  "):
+    yield f"{indent}{element['name']}  {element['schema']}"
+    if element["extent"] is not None:
+        low, high = element["extent"]
+        yield f"{indent}  extent  {low} - {high}"
+    for key, array in element["geometry"].items():
+        yield indent + "  " + _array_line(key, array)
+    for attribute in element["attributes"]:
+        label = f"attribute {attribute['name']} ({attribute['location']}, {attribute['schema']})"
+        yield indent + "  " + _array_line(label, attribute)
+    for texture in element["textures"]:
+        yield indent + "  " + _array_line(f"texture {texture['name']}", texture)
+    for child in element.get("elements", []):
+        yield from _element_lines(child, indent + "  ")
+
+
+def format_summary(summary: dict) -> str:
+    lines = [f"{summary['file']}  OMF {summary['version']}  {summary['name']}"]
+    for element in summary["elements"]:
+        lines.extend(_element_lines(element))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print the metadata of OMF files without loading their arrays")
+    parser.add_argument("files", nargs="+", help="OMF v1 or v2 files")
+    parser.add_argument("--json", action="store_true", help="one JSON summary per line")
+    args = parser.parse_args(argv)
+    status = 0
+    for filename in args.files:
+        try:
+            summary = summarize(filename)
+        except (OSError, ValueError) as exc:
+            print(f"{filename}: {exc}", file=sys.stderr)
+            status = 1
+            continue
+        print(json.dumps(summary) if args.json else format_summary(summary))
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -54,19 +54,19 @@ class Surface(BaseSurfaceElement):  # pylint: disable=R0901
     @property
     def num_nodes(self):
         """get number of nodes"""
-        return len(self.vertices.array)
+        return len(self.vertices)
 
     @property
     def num_cells(self):
         """get number of cells"""
-        return len(self.triangles.array)
+        return len(self.triangles)
 
     @properties.validator
     def _validate_mesh(self):
         """Ensure triangles values are valid indices"""
         if np.min(self.triangles.array) < 0:
             raise properties.ValidationError("Triangles may only have positive integers")
-        if np.max(self.triangles.array) >= len(self.vertices.array):
+        if np.max(self.triangles.array) >= len(self.vertices):
             raise properties.ValidationError("Triangles expects more vertices than provided")
         return True
 
@@ -6,9 +6,10 @@ import properties
 
 from .base import BaseModel, ContentModel
 from .attribute import ArrayInstanceProperty
+from .lazy import LazyModel
 
 
-class Image(BaseModel):
+class Image(LazyModel, BaseModel):
     """Class to validate and serialize a PNG image
 
     Data type and size are computed directly from the image.
@@ -20,6 +21,8 @@ class Image(BaseModel):
     """
 
     schema = "org.omf.v2.image.png"
+    _binary_property = "image"
+    _member_key = "image"
 
     image = properties.ImagePNG(
         "PNG image file",
@@ -40,6 +43,8 @@ class Image(BaseModel):
     @properties.Integer("Size of image in bytes")
     def size(self):
         """Total size of the array in bits"""
+        if not self.is_loaded and "size" in self._metadata:
+            return self._metadata["size"]
         if self.image is None:
             return None
         size = self.image.seek(0, 2)
@@ -47,6 +52,9 @@ class Image(BaseModel):
         return size
 
     def serialize(self, include_class=True, save_dynamic=False, **kwargs):
+        output = self._serialize_stored(include_class, kwargs)
+        if output is not None:
+            return output
         output = super().serialize(include_class=include_class, save_dynamic=True, **kwargs)
         image_uid = str(uuid.uuid4())
         binary_dict = kwargs.get("binary_dict", None)
@@ -64,9 +72,14 @@ class Image(BaseModel):
         elif "image" not in value:
             pass
         elif value["image"] in binary_dict:
-            return cls(io.BytesIO(binary_dict[value["image"]]))
+            return cls._from_binary(binary_dict[value["image"]], value)
         return cls()
 
+    @classmethod
+    def _decode(cls, binary, value):
+        # validation returns a stream marked as valid, any other stream is closed by validate()
+        return cls._props["image"].validate(None, io.BytesIO(binary))
+
 
 class ProjectedTexture(ContentModel):
     """Image located in space to be projected at its normal onto an element"""
@@ -1,6 +1,7 @@
 from .blockmodel import BlockModelHandler
 from .surface import SurfaceHandler
 from .lineset import LinesHandler
+from .project import ProjectHandler
 __author__ = "Denis Mikulich"
 __license__ = "MIT License"
 __copyright__ = "Copyright 2023"
\ No newline at end of file
@@ -1,15 +1,44 @@
+import os
 from pprint import pformat
 import pandas as pd
 import numpy as np
 import utils.pygltf.tools as gltf
+import utils.pygltf.tiles as tiles
+from utils.pygltf import gltf2
+from .surface import SurfaceHandler
+from .colormap import attribute_classes, attribute_gradient
+
+
+BLOCK_VERTEX_DTYPE = np.dtype([
+    ("position", np.float32, 3),
+    ("normal", np.float32, 3),
+    ("color", np.float32, 4),
+])
+# set_color thresholds and colors
+GRADE_STEPS = np.array([2.5, 3, 3.5, 4, 4.5])
+GRADE_COLORS = np.array([
+    (0, 0, 1, 1),
+    (0, 0.5, 1, 1),
+    (0, 1, 0.5, 1),
+    (1, 1, 0, 1),
+    (1, 0.5, 0, 1),
+    (1, 0, 0, 1),
+], dtype=np.float32)
 
 
 class BlockModelHandler:
-    def __init__(self, bm, filter_condition=None, compact=False) -> None:
+    # blocks generated per buffer append
+    chunk_size = 2 ** 16
+
+    def __init__(self, bm, filter_condition=None, compact=False, topography=None) -> None:
         self.bm = bm
         self.filter = filter_condition
         self.is_compact = compact
         self.name = bm.name
+        # Surface or SurfaceHandler, adds 'above_topography' column usable in filter_condition
+        if topography is not None and not isinstance(topography, SurfaceHandler):
+            topography = SurfaceHandler(topography)
+        self.topography = topography
         self._bm_dataframe = self._bm_to_pandas_dataframe()
 
     def __str__(self):
@@ -29,7 +58,9 @@ class BlockModelHandler:
     def get_bm_origin(self):
         return self.get_bm_info.get("center", self.bm.origin)
 
-    def _prepare_gltf_data(self, x_size, y_size, z_size, x, y, z, indices_offset, grade):
+    def _prepare_gltf_data(self, x_size, y_size, z_size, x, y, z, grade):
+        # vectorized over a chunk of blocks: sizes, coordinates and grades are arrays of equal length,
+        # indices are local to the chunk
         if not self.is_compact:
             buffer_array_size = 24
             # v6----------v5
@@ -127,48 +158,310 @@ class BlockModelHandler:
                 3, 5, 7,  # Second triangle (top-back-right, bottom-front-right, top-front-right)
             ]
 
-        vertex_data = np.zeros(buffer_array_size, dtype=[
-            ("position", np.float32, 3),
-            ("normal", np.float32, 3),
-            ("color", np.float32, 4),
-        ])
-
-        vertex_data["position"] = vertexes
-        vertex_data["normal"] = normals
-        index_data = np.array(indexes, dtype=np.uint16) + indices_offset * buffer_array_size
-        color = self.set_color(grade)
-        vertex_data["color"] = [color] * buffer_array_size
-        vertex_data["normal"] = [gltf.normalize_vector(np.array(normal)) for normal in vertex_data["normal"]]
-
-        return vertex_data, index_data
-
-    def create_gltf_from_dataframe(self, location):
-        vertex_data_list = []
-        index_data_list = []
-        indices_offset = 0
-
-        for index, block in self.get_bm_dataframe.iterrows():
-            vertex_data, index_data = self._prepare_gltf_data(block['x_size'], block['y_size'], block['z_size'],
-                                                              block['x_coord'],block['y_coord'], block['z_coord'],
-                                                              indices_offset, block['CU_pct'])
-            indices_offset += 1
-
-            vertex_data_list.append(vertex_data)
-            index_data_list.append(index_data)
-
-        # Concatenate data
-        final_vertex_data = np.concatenate(vertex_data_list)
-        final_index_data = np.concatenate(index_data_list)
+        block_count = len(x)
+        vertex_data = np.zeros((block_count, buffer_array_size), dtype=BLOCK_VERTEX_DTYPE)
+
+        # (vertex, axis, block) -> (block, vertex, axis)
+        vertex_data["position"] = np.array(vertexes, dtype=np.float64).transpose(2, 0, 1)
+        vertex_data["normal"] = gltf.normalize_vectors(np.array(normals, dtype=np.float64))
+        vertex_data["color"] = self.grade_colors(grade)[:, None, :]
+        index_data = np.array(indexes, dtype=np.int64) + (np.arange(block_count) * buffer_array_size)[:, None]
+
+        return vertex_data.ravel(), index_data.ravel()
+
+    def gltf_mesh_data(self, weld=False, tolerance=None, attributes=None, encoding="float32", colormap_texture=False,
+                       material_per_class=False, path=None, dataframe=None, color_attribute=None):
+        """Vertex and index arrays of the blocks with what numpy_to_gltf and add_mesh_materials need
+
+        Options as in create_gltf_from_dataframe, with path the arrays are memory-mapped scratch
+        files next to it. The BufferBuilder holding the arrays is returned under "builder",
+        close it once the arrays are written. dataframe replaces the handler blocks, e.g. with
+        a coarser level from get_lod_dataframe.
+        """
+        if colormap_texture and material_per_class:
+            raise ValueError("colormap_texture and material_per_class are exclusive")
+        if color_attribute is None and 'CU_pct' in self.get_bm_attributes_list:
+            color_attribute = 'CU_pct'
+        if (colormap_texture or material_per_class) and color_attribute is None:
+            raise ValueError("colormap_texture and material_per_class need a color_attribute")
+        df = self.get_bm_dataframe if dataframe is None else dataframe
+        block_count = len(df)
+        vertices_per_block = 8 if self.is_compact else 24
+        order, index_ranges = slice(None), None
+        if material_per_class:
+            classes, class_colors, class_names = attribute_classes(self._get_attribute(color_attribute),
+                                                                   df[color_attribute].to_numpy())
+            order = np.argsort(classes, kind="stable")
+            index_ranges, present = gltf.class_ranges(classes, 36)
+        custom, extras = gltf.encode_custom_attributes({name: df[name].to_numpy()[order]
+                                                        for name in attributes or []}, encoding)
+        exclude = ()
+        if colormap_texture:
+            gradient, limits = attribute_gradient(self._get_attribute(color_attribute))
+            custom["texCoord0"] = gltf.colormap_texcoords(df[color_attribute].to_numpy()[order], limits)
+            exclude = ("color",)
+        elif material_per_class or color_attribute is None:
+            # without a color attribute blocks get the default glTF material
+            exclude = ("color",)
+        vertex_dtype = gltf.extend_vertex_data(np.zeros(0, BLOCK_VERTEX_DTYPE),
+                                               {name: values[:0] for name, values in custom.items()},
+                                               exclude=exclude).dtype
+        builder = gltf.BufferBuilder(vertex_dtype, vertex_count=block_count * vertices_per_block,
+                                     index_count=block_count * 36, path=path)
+        columns = [df[column].to_numpy()[order] for column in
+                   ('x_size', 'y_size', 'z_size', 'x_coord', 'y_coord', 'z_coord')]
+        # grade colors are dropped with a texture or class materials, the attribute may not even be numeric
+        columns.append(np.zeros(block_count) if exclude else df[color_attribute].to_numpy()[order])
+        for start in range(0, block_count, self.chunk_size):
+            chunk = [column[start:start + self.chunk_size] for column in columns]
+            vertex_data, index_data = self._prepare_gltf_data(*chunk)
+            if custom or exclude:
+                vertex_data = gltf.extend_vertex_data(vertex_data, {
+                    name: np.repeat(values[start:start + self.chunk_size], vertices_per_block, axis=0)
+                    for name, values in custom.items()}, exclude=exclude)
+            builder.append(vertex_data, index_data)
+
+        final_vertex_data = builder.vertex_data
+        final_index_data = builder.index_data
+        bounds = builder.bounds
+        if weld:
+            # compact corner normals differ between neighbouring blocks, so they are averaged instead of compared
+            fields = [name for name in vertex_dtype.names if name != "normal"] if self.is_compact else None
+            final_vertex_data, final_index_data = gltf.weld_vertices(final_vertex_data, final_index_data,
+                                                                     fields=fields, tolerance=tolerance)
+            bounds = None
+
+        mesh_data = {"vertex_data": final_vertex_data, "index_data": final_index_data, "mode": "TRIANGLES",
+                     "index_ranges": index_ranges, "bounds": bounds, "attribute_extras": extras, "builder": builder}
+        if colormap_texture:
+            mesh_data["gradient"] = gradient
+        if material_per_class:
+            mesh_data.update(class_colors=class_colors[present], class_names=[class_names[n] for n in present])
+        return mesh_data
+
+    def create_gltf_from_dataframe(self, location, weld=False, tolerance=None, binary=False, streaming=False,
+                                   attributes=None, encoding="float32", colormap_texture=False,
+                                   material_per_class=False, color_attribute=None):
+        """Export the filtered blocks, colored by color_attribute with the grade colors
+
+        color_attribute defaults to CU_pct, blocks without it are left uncolored with the
+        default glTF material.
+
+        Blocks are generated chunk_size at a time straight into a preallocated buffer,
+        with streaming=True the buffers are memory-mapped scratch files next to location.
+        attributes, a list of dataframe columns, are added as custom vertex attributes
+        (e.g. CU_pct -> _CU_PCT) encoded as float32, float16 or uint16, see
+        gltf.encode_custom_attribute. With colormap_texture=True color_attribute is written as
+        TEXCOORD_0 into a colormap texture (<location>_colormap.png) instead of vertex colors.
+        The colormap limits are baked into TEXCOORD_0: replacing the PNG changes the colors,
+        other limits need a new export.
+        With material_per_class, for a color_attribute with a Discrete or Category colormap,
+        blocks are sorted by class and written as one primitive per class with its own base
+        color material, without COLOR_0.
+        """
+        mesh_data = self.gltf_mesh_data(weld, tolerance, attributes, encoding, colormap_texture, material_per_class,
+                                        path=location if streaming else None, color_attribute=color_attribute)
+        gltf_path = f"{location}.gltf"
+        bin_path = f"{location}.bin"
+
+        try:
+            document, buffers = gltf.numpy_mesh_to_gltf(mesh_data, gltf_path, bin_path)
+            gltf.add_mesh_materials(location, document, mesh_data)
+
+            if binary:
+                gltf.save_glb(f"{location}.glb", document, buffers)
+            else:
+                gltf.save(gltf_path, bin_path, document, buffers)
+        finally:
+            mesh_data["builder"].close()
+
+    def create_tileset(self, location, max_items=2 ** 18, max_depth=8, quadtree=False, **options):
+        """Export the blocks as GLB tiles under the location directory with a tileset.json index
+
+        Block triangles are split by an octree (quadtree=True: x and y only) until a tile holds
+        at most max_items of them, see tiles.save_tileset. options as in gltf_mesh_data.
+        """
+        mesh_data = self.gltf_mesh_data(**options)
+        try:
+            return tiles.save_tileset(location, mesh_data, max_items, max_depth, quadtree)
+        finally:
+            mesh_data["builder"].close()
+
+    def get_lod_dataframe(self, level):
+        """Blocks of the grid coarsened 2**level times along every axis
+
+        Every coarse block spans up to 2**level cells per axis (fewer at the grid end) and
+        exists when it holds at least one of the handler blocks. Numeric attributes are the
+        volume weighted mean of those blocks (NaN ignored), category attributes take the
+        category with the largest volume. Only geometry and attribute columns are kept.
+        """
+        df = self.get_bm_dataframe
+        if level == 0:
+            return df
+        factor = 2 ** level
+        fine = df['ijk_index'].str.split('-', expand=True).to_numpy(dtype=np.int64)
+        coarse = fine // factor
+        shape = [(len(tensor) + factor - 1) // factor for tensor in (self.bm.tensor_u, self.bm.tensor_v, self.bm.tensor_w)]
+        key = np.ravel_multi_index(coarse.T, shape)
+        keys, group = np.unique(key, return_inverse=True)
+        ijk = np.stack(np.unravel_index(keys, shape), axis=1)
+
+        sizes, coords = {}, {}
+        origin = np.array(self.get_bm_origin, dtype=np.float64)
+        for axis, (tensor, name) in enumerate(zip((self.bm.tensor_u, self.bm.tensor_v, self.bm.tensor_w), 'xyz')):
+            edges = np.cumsum(np.insert(np.asarray(tensor, dtype=np.float64), 0, 0)) + origin[axis]
+            low = edges[ijk[:, axis] * factor]
+            high = edges[np.minimum((ijk[:, axis] + 1) * factor, len(tensor))]
+            sizes[f'{name}_size'] = high - low
+            coords[f'{name}_coord'] = low
+        lod = {**sizes, **coords}
+
+        volume = (df['x_size'] * df['y_size'] * df['z_size']).to_numpy(dtype=np.float64)
+        for attribute in self.bm.attributes:
+            if attribute.name not in df:
+                continue
+            values = df[attribute.name].to_numpy()
+            if getattr(attribute, "categories", None) is not None:
+                lod[attribute.name] = self._majority(values, group, volume, len(keys))
+            else:
+                values = values.astype(np.float64)
+                known = ~np.isnan(values)
+                weight = np.bincount(group, volume * known, minlength=len(keys))
+                total = np.bincount(group, np.where(known, values, 0) * volume, minlength=len(keys))
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    lod[attribute.name] = total / weight
+        return pd.DataFrame(lod)
+
+    @staticmethod
+    def _majority(values, group, weights, group_count):
+        # value with the largest summed weight inside every group, ties go to the smaller value
+        categories, code = np.unique(values, return_inverse=True)
+        pair, pair_group = np.unique(group * len(categories) + code, return_inverse=True)
+        pair_weight = np.bincount(pair_group, weights)
+        order = np.lexsort((-pair_weight, pair // len(categories)))
+        first = np.r_[True, np.diff(pair[order] // len(categories)) != 0]
+        result = np.empty(group_count, dtype=categories.dtype)
+        result[pair[order][first] // len(categories)] = categories[pair[order][first] % len(categories)]
+        return result
+
+    def get_lod_error(self, level):
+        """Largest block diagonal of a level, the geometric error of drawing it instead of level 0"""
+        if level == 0:
+            return 0.0
+        df = self.get_lod_dataframe(level)
+        return float(np.sqrt(df['x_size'] ** 2 + df['y_size'] ** 2 + df['z_size'] ** 2).max())
+
+    def create_gltf_lod(self, location, levels=3, binary=False, screen_coverage=None, **options):
+        """Export the blocks and levels coarser versions as one document linked with MSFT_lod
+
+        The level 0 node carries the MSFT_lod extension listing the coarser nodes, which are
+        left out of the scene, and the MSFT_screencoverage extras (default halving from 0.5)
+        the viewer switches levels at. options as in gltf_mesh_data.
+        """
+        screen_coverage = [0.5 ** (level + 1) for level in range(levels + 1)] if screen_coverage is None \
+            else screen_coverage
+        if len(screen_coverage) != levels + 1:
+            raise ValueError("screen_coverage needs one value per level")
         gltf_path = f"{location}.gltf"
         bin_path = f"{location}.bin"
+        document = gltf2.Document(extensionsUsed=["MSFT_lod"])
+        buffers = []
+        buffer = gltf2.Buffer(0, uri=os.path.basename(bin_path), name="Default Buffer")
+        document.add_buffer(buffer)
+        nodes = []
+        # every level stays in the buffers until the document is saved
+        builders = []
+        try:
+            for level in range(levels + 1):
+                mesh_data = self._lod_mesh_data(level, options)
+                builders.append(mesh_data["builder"])
+                mesh = gltf.add_mesh(document, buffer, buffers, mesh_data["vertex_data"], mesh_data["index_data"],
+                                     mesh_data["mode"], mesh_data["index_ranges"], mesh_data["bounds"],
+                                     mesh_data["attribute_extras"], name=f"{self.name} LOD{level}")
+                gltf.add_mesh_materials(f"{location}_lod{level}", document, mesh_data, mesh=mesh)
+                node = gltf2.Node(name=f"{self.name} LOD{level}", mesh=mesh)
+                document.add_node(node)
+                nodes.append(node)
+            buffer.byteLength = gltf.byteLength(buffers)
+            nodes[0].extensions = {"MSFT_lod": {"ids": [node.key for node in nodes[1:]]}}
+            nodes[0].extras = {"MSFT_screencoverage": list(screen_coverage)}
+            scene = gltf2.Scene(name="Default Scene", nodes=nodes[:1])
+            document.add_scene(scene)
+            document.scene = scene
+
+            if binary:
+                gltf.save_glb(f"{location}.glb", document, buffers)
+            else:
+                gltf.save(gltf_path, bin_path, document, buffers)
+        finally:
+            for builder in builders:
+                builder.close()
+
+    def create_lod_tileset(self, location, levels=3, **options):
+        """Export every level as a GLB under the location directory chained in a tileset.json
+
+        The coarsest level is the root, each finer level replaces its parent ("REPLACE"
+        refinement) once the viewer error exceeds the parent geometric error.
+        """
+        errors = [self.get_lod_error(level) for level in range(levels + 1)]
 
-        document, buffers = gltf.numpy_to_gltf(final_vertex_data,
-                                               final_index_data,
-                                               gltf_path,
-                                               bin_path,
-                                               "TRIANGLES")
+        def level_data():
+            # one level in memory at a time, its builder is closed once the tile is written
+            for level in range(levels + 1):
+                mesh_data = self._lod_mesh_data(level, options)
+                try:
+                    yield mesh_data
+                finally:
+                    mesh_data["builder"].close()
 
-        gltf.save(gltf_path, bin_path, document, buffers)
+        level_iterator = level_data()
+        try:
+            return tiles.save_lod_tileset(location, level_iterator, errors)
+        finally:
+            level_iterator.close()
+
+    def _lod_mesh_data(self, level, options):
+        # levels get their own scratch files, a shared path would let them overwrite each other
+        if options.get("path") is not None:
+            options = {**options, "path": f"{options['path']}_lod{level}"}
+        return self.gltf_mesh_data(dataframe=self.get_lod_dataframe(level), **options)
+
+    def create_gltf_update(self, location, base_location, filter_condition=None, grade_steps=None):
+        """Delta export over <base_location>.gltf, a plain (not welded, not class split) export of these blocks
+
+        Blocks failing filter_condition (same form as the constructor one) get a _HIDDEN
+        vertex attribute of 1, blocks whose color changes with the new grade_steps get
+        their new COLOR_0. Both are written as sparse accessors into <location>.gltf/.bin,
+        the base geometry buffer is referenced as is. Returns False, writing nothing, when
+        no block changes.
+        """
+        df = self.get_bm_dataframe
+        vertices_per_block = 8 if self.is_compact else 24
+        document, buffers = gltf.load(f"{base_location}.gltf")
+        attributes = document.meshes[0].primitives[0].attributes
+        if attributes[gltf.ATTRIBUTE_BY_NAME["position"]].count != len(df) * vertices_per_block:
+            raise ValueError(f"{base_location}.gltf does not hold the {len(df)} blocks of this handler")
+
+        def block_vertices(blocks):
+            return (blocks[:, None] * vertices_per_block + np.arange(vertices_per_block)).ravel()
+
+        changes = {}
+        if grade_steps is not None:
+            if gltf.ATTRIBUTE_BY_NAME["color"] not in attributes:
+                raise ValueError(f"{base_location}.gltf has no vertex colors to update")
+            colors = self.grade_colors(df['CU_pct'].to_numpy(), grade_steps)
+            previous = gltf.accessor_array(document, buffers, attributes[gltf.ATTRIBUTE_BY_NAME["color"]])
+            changed = np.flatnonzero(np.any(previous[::vertices_per_block] != colors, axis=1))
+            changes["COLOR_0"] = (block_vertices(changed), np.repeat(colors[changed], vertices_per_block, axis=0))
+        if filter_condition:
+            hidden = np.flatnonzero(~df.eval(self._query_string(filter_condition)).to_numpy())
+            changes["_HIDDEN"] = (block_vertices(hidden), np.ones(len(hidden) * vertices_per_block, dtype=np.uint8))
+        return gltf.save_sparse_update(f"{base_location}.gltf", location, changes) is not None
+
+    @staticmethod
+    def grade_colors(grades, grade_steps=GRADE_STEPS):
+        """Vectorized set_color, grade_steps are the five thresholds between GRADE_COLORS"""
+        return GRADE_COLORS[np.digitize(np.asarray(grades, dtype=np.float64), grade_steps)]
 
     def set_color(self, grade):
         if grade < 2.5:
@@ -207,15 +500,25 @@ class BlockModelHandler:
             for key, value in attribute.items():
                 df[key] = value.flatten(order="F")
 
+        if self.topography is not None:
+            # block centroids are compared against the cached surface height grid
+            df["above_topography"] = self.topography.is_above_surface(df["x_coord"].to_numpy() + df["x_size"].to_numpy() / 2,
+                                                                      df["y_coord"].to_numpy() + df["y_size"].to_numpy() / 2,
+                                                                      df["z_coord"].to_numpy() + df["z_size"].to_numpy() / 2)
+
         if self.filter:
             return df.query(self._filter_query_string)
         return df
 
     @property
     def _filter_query_string(self):
+        return self._query_string(self.filter)
+
+    @staticmethod
+    def _query_string(filter_condition):
         # example: {'CU_pct': ['>=', 2.4], 'rocktype': ['!=', 'air']}
         query_string = ""
-        for i, (column, condition) in enumerate(self.filter.items()):
+        for i, (column, condition) in enumerate(filter_condition.items()):
             operator = condition[0]
             value = condition[1]
             if i > 0:
@@ -223,6 +526,12 @@ class BlockModelHandler:
             query_string += f"{column} {operator} {value}"
         return query_string
 
+    def _get_attribute(self, name):
+        for attribute in self.bm.attributes:
+            if attribute.name == name:
+                return attribute
+        raise KeyError(f"Block model {self.bm.name} has no attribute {name}")
+
     @property
     def _get_attribute_list(self):
         bm_attribute_list = []
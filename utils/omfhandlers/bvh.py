@@ -0,0 +1,309 @@
+import os
+import zlib
+import numpy as np
+
+
+def _ranges(starts, counts):
+    # concatenated aranges [start, start + count) for every (start, count) pair
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - offsets, counts) + np.arange(counts.sum())
+
+
+def _dot(a, b):
+    return np.einsum("ij,ij->i", a, b)
+
+
+def _closest_points(p, a, b, c):
+    # Ericson, Real-Time Collision Detection 5.1.5, evaluated for all regions at once
+    ab, ac, ap = b - a, c - a, p - a
+    bp, cp = p - b, p - c
+    d1, d2 = _dot(ab, ap), _dot(ac, ap)
+    d3, d4 = _dot(ab, bp), _dot(ac, bp)
+    d5, d6 = _dot(ab, cp), _dot(ac, cp)
+    va, vb, vc = d3 * d6 - d5 * d4, d5 * d2 - d1 * d6, d1 * d4 - d3 * d2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        candidates = [
+            a,
+            b,
+            a + ab * (d1 / (d1 - d3))[:, None],
+            c,
+            a + ac * (d2 / (d2 - d6))[:, None],
+            b + (c - b) * ((d4 - d3) / ((d4 - d3) + (d5 - d6)))[:, None],
+            a + ab * (vb / (va + vb + vc))[:, None] + ac * (vc / (va + vb + vc))[:, None],
+        ]
+    conditions = [
+        (d1 <= 0) & (d2 <= 0),
+        (d3 >= 0) & (d4 <= d3),
+        (vc <= 0) & (d1 >= 0) & (d3 <= 0),
+        (d6 >= 0) & (d5 <= d6),
+        (vb <= 0) & (d2 >= 0) & (d6 <= 0),
+        (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0),
+        np.ones(len(p), dtype=bool),
+    ]
+    return np.select([condition[:, None] for condition in conditions], candidates)
+
+
+def _box_distance2(points, box_min, box_max):
+    delta = np.maximum(np.maximum(box_min - points, points - box_max), 0)
+    return _dot(delta, delta)
+
+
+class TriangleBVH:
+    """Bounding volume hierarchy over surface triangles.
+
+    The tree is built level by level with median splits along the longest centroid
+    extent of every node; each level is a single lexsort over all triangles that still
+    need splitting. Nodes are stored in flat arrays, children of node ``n`` are
+    ``left[n]`` and ``left[n] + 1``, leaves have ``left == -1`` and own the triangles
+    ``order[start:start + count]``.
+
+    Queries walk the tree breadth first for a whole batch at once, keeping one
+    (query, node) pair per active branch.
+    """
+    leaf_size = 8
+    # nearest triangle queries are processed in batches of this many points to bound memory
+    query_batch = 2 ** 12
+
+    def __init__(self, vertices, triangles, leaf_size=None, nodes=None) -> None:
+        self.vertices = np.asarray(vertices, dtype=np.float64)
+        self.triangles = np.asarray(triangles, dtype=np.int64)
+        if leaf_size is not None:
+            self.leaf_size = int(leaf_size)
+        if nodes is None:
+            nodes = self._build()
+        self.order = nodes["order"]
+        self.node_min = nodes["node_min"]
+        self.node_max = nodes["node_max"]
+        self.node_start = nodes["node_start"]
+        self.node_count = nodes["node_count"]
+        self.node_left = nodes["node_left"]
+
+    def __str__(self):
+        return f'Instance of {__class__.__name__}, {len(self.triangles)} triangles, {len(self.node_left)} nodes'
+
+    @property
+    def fingerprint(self):
+        """Checksum of the geometry, used to validate cached trees"""
+        checksum = zlib.crc32(memoryview(np.ascontiguousarray(self.vertices)).cast("B"))
+        checksum = zlib.crc32(memoryview(np.ascontiguousarray(self.triangles)).cast("B"), checksum)
+        return np.array([len(self.vertices), len(self.triangles), self.leaf_size, checksum], dtype=np.int64)
+
+    def _corners(self, triangles):
+        return [self.vertices[self.triangles[triangles, n]] for n in range(3)]
+
+    def _build(self):
+        a, b, c = self._corners(slice(None))
+        tri_min = np.minimum(np.minimum(a, b), c)
+        tri_max = np.maximum(np.maximum(a, b), c)
+        centroid = (a + b + c) / 3
+        order = np.arange(len(self.triangles))
+
+        node_min, node_max, node_start, node_count, node_left = [], [], [], [], []
+        starts, counts = np.array([0]), np.array([len(order)])
+        next_id = 1
+        while len(starts):
+            # bounds of every node on this level
+            members = order[_ranges(starts, counts)]
+            offsets = np.cumsum(counts) - counts
+            node_min.append(np.minimum.reduceat(tri_min[members], offsets))
+            node_max.append(np.maximum.reduceat(tri_max[members], offsets))
+            node_start.append(starts)
+            node_count.append(counts)
+
+            split = counts > self.leaf_size
+            left = np.full(len(starts), -1)
+            left[split] = next_id + 2 * np.arange(split.sum())
+            node_left.append(left)
+            next_id += 2 * split.sum()
+            if not split.any():
+                break
+
+            starts, counts = starts[split], counts[split]
+            positions = _ranges(starts, counts)
+            members = order[positions]
+            offsets = np.cumsum(counts) - counts
+            segment = np.repeat(np.arange(len(starts)), counts)
+            extent = np.maximum.reduceat(centroid[members], offsets) - np.minimum.reduceat(centroid[members], offsets)
+            axis = np.argmax(extent, axis=1)
+            order[positions] = members[np.lexsort((centroid[members, axis[segment]], segment))]
+
+            half = counts // 2
+            starts = np.stack([starts, starts + half], axis=1).ravel()
+            counts = np.stack([half, counts - half], axis=1).ravel()
+
+        return {"order": order,
+                "node_min": np.concatenate(node_min), "node_max": np.concatenate(node_max),
+                "node_start": np.concatenate(node_start), "node_count": np.concatenate(node_count),
+                "node_left": np.concatenate(node_left)}
+
+    def _leaf_pairs(self, query, node):
+        counts = self.node_count[node]
+        return np.repeat(query, counts), self.order[_ranges(self.node_start[node], counts)]
+
+    @staticmethod
+    def _children(query, node, left):
+        return np.concatenate([query, query]), np.concatenate([left, left + 1])
+
+    def _ray_triangle(self, origins, directions, triangles):
+        # Moller-Trumbore, misses are inf
+        a, b, c = self._corners(triangles)
+        ab, ac = b - a, c - a
+        p = np.cross(directions, ac)
+        det = _dot(ab, p)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            inv_det = 1.0 / det
+            s = origins - a
+            u = _dot(s, p) * inv_det
+            q = np.cross(s, ab)
+            v = _dot(directions, q) * inv_det
+            t = _dot(ac, q) * inv_det
+        hit = (np.abs(det) > 1e-12) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0)
+        return np.where(hit, t, np.inf)
+
+    def intersect(self, origins, directions, max_distance=np.inf):
+        """First hit of every ray, returns triangle indices (-1 for no hit) and distances along the rays
+
+        Distances are in units of the direction length, use unit directions to get
+        metric distances. max_distance may be a scalar or one value per ray.
+        """
+        origins = np.atleast_2d(np.asarray(origins, dtype=np.float64))
+        directions = np.broadcast_to(np.asarray(directions, dtype=np.float64), origins.shape)
+        with np.errstate(divide="ignore"):
+            inverse = 1.0 / directions
+        best_t = np.broadcast_to(np.asarray(max_distance, dtype=np.float64), len(origins)).copy()
+        best_triangle = np.full(len(origins), -1)
+
+        ray, node = np.arange(len(origins)), np.zeros(len(origins), dtype=np.int64)
+        while len(ray):
+            with np.errstate(invalid="ignore"):
+                t1 = (self.node_min[node] - origins[ray]) * inverse[ray]
+                t2 = (self.node_max[node] - origins[ray]) * inverse[ray]
+            t_near = np.fmax.reduce(np.fmin(t1, t2), axis=1)
+            t_far = np.fmin.reduce(np.fmax(t1, t2), axis=1)
+            hit = (t_far >= np.maximum(t_near, 0)) & (t_near <= best_t[ray])
+            ray, node = ray[hit], node[hit]
+
+            leaf = self.node_left[node] < 0
+            pair_ray, pair_triangle = self._leaf_pairs(ray[leaf], node[leaf])
+            if len(pair_ray):
+                t = self._ray_triangle(origins[pair_ray], directions[pair_ray], pair_triangle)
+                np.minimum.at(best_t, pair_ray, t)
+                closest = (t == best_t[pair_ray]) & np.isfinite(t)
+                best_triangle[pair_ray[closest]] = pair_triangle[closest]
+            ray, node = self._children(ray[~leaf], node[~leaf], self.node_left[node[~leaf]])
+
+        best_t[best_triangle < 0] = np.inf
+        return best_triangle, best_t
+
+    def project_vertical(self, x, y):
+        """Elevation of the highest triangle above every xy point, NaN where there is none"""
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+        top = self.node_max[0, 2] + 1.0
+        origins = np.stack([x.ravel(), y.ravel(), np.full(x.size, top)], axis=1)
+        _, t = self.intersect(origins, np.array([0.0, 0.0, -1.0]))
+        return (top - t).reshape(x.shape) if x.ndim else float(top - t[0])
+
+    def is_occluded(self, start, end):
+        """True where the straight segment between the point pairs crosses the surface"""
+        start = np.atleast_2d(np.asarray(start, dtype=np.float64))
+        direction = np.atleast_2d(np.asarray(end, dtype=np.float64)) - start
+        length = np.linalg.norm(direction, axis=1, keepdims=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            direction = direction / length
+        triangle, _ = self.intersect(start, direction, max_distance=length[:, 0])
+        return triangle >= 0
+
+    def nearest(self, points):
+        """Closest triangle to every point, returns triangle indices, distances and closest points"""
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        best_d2 = np.full(len(points), np.inf)
+        best_triangle = np.full(len(points), -1)
+        best_point = np.full(points.shape, np.nan)
+        for start in range(0, len(points), self.query_batch):
+            batch = slice(start, start + self.query_batch)
+            best_triangle[batch], best_d2[batch], best_point[batch] = self._nearest(points[batch])
+        return best_triangle, np.sqrt(best_d2), best_point
+
+    def _nearest(self, points):
+        best_d2 = np.full(len(points), np.inf)
+        best_triangle = np.full(len(points), -1)
+        best_point = np.full(points.shape, np.nan)
+        # the farthest corner of any visited box bounds the distance to the nearest triangle
+        bound_d2 = np.full(len(points), np.inf)
+
+        def visit_leaves(query, node):
+            pair_query, pair_triangle = self._leaf_pairs(query, node)
+            if not len(pair_query):
+                return
+            closest = _closest_points(points[pair_query], *self._corners(pair_triangle))
+            d2 = np.sum((closest - points[pair_query]) ** 2, axis=1)
+            np.minimum.at(best_d2, pair_query, d2)
+            is_best = d2 == best_d2[pair_query]
+            best_triangle[pair_query[is_best]] = pair_triangle[is_best]
+            best_point[pair_query[is_best]] = closest[is_best]
+            np.minimum(bound_d2, best_d2, out=bound_d2)
+
+        # greedy descent towards the nearest child box gives a first bound to prune with
+        query, node = np.arange(len(points)), np.zeros(len(points), dtype=np.int64)
+        while True:
+            inner = self.node_left[node] >= 0
+            if not inner.any():
+                break
+            left = self.node_left[node[inner]]
+            d_left = _box_distance2(points[query[inner]], self.node_min[left], self.node_max[left])
+            d_right = _box_distance2(points[query[inner]], self.node_min[left + 1], self.node_max[left + 1])
+            node[inner] = np.where(d_left <= d_right, left, left + 1)
+        visit_leaves(query, node)
+
+        query, node = np.arange(len(points)), np.zeros(len(points), dtype=np.int64)
+        while len(query):
+            keep = _box_distance2(points[query], self.node_min[node], self.node_max[node]) <= bound_d2[query]
+            query, node = query[keep], node[keep]
+            far = np.maximum(np.abs(points[query] - self.node_min[node]), np.abs(points[query] - self.node_max[node]))
+            np.minimum.at(bound_d2, query, _dot(far, far))
+            leaf = self.node_left[node] < 0
+            visit_leaves(query[leaf], node[leaf])
+            query, node = self._children(query[~leaf], node[~leaf], self.node_left[node[~leaf]])
+
+        return best_triangle, best_d2, best_point
+
+    def query_box(self, box_min, box_max):
+        """Indices of triangles whose bounding boxes overlap the axis aligned box"""
+        box_min = np.asarray(box_min, dtype=np.float64)
+        box_max = np.asarray(box_max, dtype=np.float64)
+        node = np.zeros(1, dtype=np.int64)
+        found = []
+        while len(node):
+            overlap = np.all((self.node_min[node] <= box_max) & (self.node_max[node] >= box_min), axis=1)
+            node = node[overlap]
+            leaf = self.node_left[node] < 0
+            _, triangles = self._leaf_pairs(node[leaf], node[leaf])
+            if len(triangles):
+                a, b, c = self._corners(triangles)
+                tri_min = np.minimum(np.minimum(a, b), c)
+                tri_max = np.maximum(np.maximum(a, b), c)
+                found.append(triangles[np.all((tri_min <= box_max) & (tri_max >= box_min), axis=1)])
+            left = self.node_left[node[~leaf]]
+            node = np.concatenate([left, left + 1])
+        return np.sort(np.concatenate(found)) if found else np.zeros(0, dtype=np.int64)
+
+    def save(self, filename):
+        """Store the tree as an uncompressed .npz file under exactly this name"""
+        # np.savez adds ".npz" to names without it, a file object keeps the name load() looks for
+        with open(filename, "wb") as f:
+            np.savez(f, fingerprint=self.fingerprint, order=self.order,
+                     node_min=self.node_min, node_max=self.node_max, node_start=self.node_start,
+                     node_count=self.node_count, node_left=self.node_left)
+
+    @classmethod
+    def load(cls, filename, vertices, triangles):
+        """Restore a tree saved for the same geometry, returns None if the cache is stale"""
+        if not os.path.exists(filename):
+            return None
+        with np.load(filename) as data:
+            nodes = {key: data[key] for key in data.files}
+        fingerprint = nodes.pop("fingerprint")
+        bvh = cls(vertices, triangles, leaf_size=int(fingerprint[2]), nodes=nodes)
+        if not np.array_equal(bvh.fingerprint, fingerprint):
+            return None
+        return bvh
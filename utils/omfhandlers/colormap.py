@@ -0,0 +1,130 @@
+import numpy as np
+
+# same ramp BlockModelHandler.set_color steps through, used when an attribute has no colormap
+DEFAULT_GRADIENT = np.array([
+    (0, 0, 1),
+    (0, 0.5, 1),
+    (0, 1, 0.5),
+    (1, 1, 0),
+    (1, 0.5, 0),
+    (1, 0, 0),
+], dtype=np.float32)
+NO_DATA_COLOR = (0.5, 0.5, 0.5, 1)
+
+
+def _rgba(colors):
+    colors = np.asarray(colors, dtype=np.float32).reshape(-1, 3)
+    return np.concatenate([colors, np.ones((len(colors), 1), dtype=np.float32)], axis=1)
+
+
+def gradient_colors(values, gradient, limits):
+    """Linear interpolation of the values along the gradient rows, clamped to the limits"""
+    values = np.asarray(values, dtype=np.float64)
+    low, high = limits
+    scale = (high - low) if high > low else 1.0
+    position = np.clip((values - low) / scale, 0, 1) * (len(gradient) - 1)
+    lower = np.floor(np.nan_to_num(position)).astype(np.int64)
+    upper = np.minimum(lower + 1, len(gradient) - 1)
+    weight = (position - lower)[:, None]
+    colors = _rgba(gradient)
+    result = colors[lower] * (1 - weight) + colors[upper] * weight
+    result[np.isnan(values)] = NO_DATA_COLOR
+    return result.astype(np.float32)
+
+
+def discrete_colors(values, end_points, end_inclusive, colors):
+    values = np.asarray(values, dtype=np.float64)
+    end_points = np.asarray(end_points, dtype=np.float64)
+    inclusive = np.asarray(end_inclusive, dtype=bool)
+    # a value equal to an inclusive end point stays in the lower interval
+    interval = np.sum((values[:, None] > end_points) | ((values[:, None] == end_points) & ~inclusive), axis=1)
+    result = _rgba(np.asarray(colors, dtype=np.float32) / 255)[interval]
+    result[np.isnan(values)] = NO_DATA_COLOR
+    return result
+
+
+def category_colors(values, indices, colors):
+    values = np.asarray(values)
+    result = np.tile(np.asarray(NO_DATA_COLOR, dtype=np.float32), (len(values), 1))
+    if not colors:
+        return result
+    indices = np.asarray(indices)
+    order = np.argsort(indices)
+    position = np.clip(np.searchsorted(indices[order], values), 0, len(indices) - 1)
+    known = indices[order][position] == values
+    result[known] = _rgba(np.asarray(colors, dtype=np.float32) / 255)[order][position[known]]
+    return result
+
+
+def attribute_colors(attribute, limits=None):
+    """RGBA float32 colors for every value of an OMF attribute through its colormap
+
+    Attributes without a colormap use DEFAULT_GRADIENT over limits, which default to
+    the attribute value range.
+    """
+    values = attribute.array.array
+    colormap = getattr(attribute, "colormap", None)
+    categories = getattr(attribute, "categories", None)
+    if categories is not None:
+        return category_colors(values, categories.indices, categories.colors)
+    if colormap is not None and hasattr(colormap, "end_points"):
+        return discrete_colors(values, colormap.end_points, colormap.end_inclusive, colormap.colors)
+    if colormap is not None:
+        gradient = colormap.gradient.array / 255
+        return gradient_colors(values, gradient, colormap.limits if limits is None else limits)
+    return gradient_colors(values, DEFAULT_GRADIENT, value_limits(values) if limits is None else limits)
+
+
+def attribute_gradient(attribute, limits=None):
+    """Gradient (N x 3, 0-1) and limits used to color a numeric attribute through a 1D texture
+
+    The ContinuousColormap of the attribute if it has one, DEFAULT_GRADIENT over the
+    value range otherwise.
+    """
+    colormap = getattr(attribute, "colormap", None)
+    if colormap is not None and hasattr(colormap, "gradient"):
+        return colormap.gradient.array / 255, colormap.limits if limits is None else limits
+    return DEFAULT_GRADIENT, value_limits(attribute.array.array) if limits is None else limits
+
+
+def value_limits(values):
+    values = np.asarray(values, dtype=np.float64)
+    finite = values[np.isfinite(values)]
+    return (finite.min(), finite.max()) if len(finite) else (0.0, 1.0)
+
+
+def attribute_classes(attribute, values=None):
+    """Class of every value of a Discrete or Category attribute, with the class RGBA colors and names
+
+    values default to the attribute array. Values outside every class (NaN, unknown
+    categories) fall in a trailing no-data class.
+    """
+    values = attribute.array.array if values is None else values
+    colormap = getattr(attribute, "colormap", None)
+    categories = getattr(attribute, "categories", None)
+    if categories is not None:
+        values = np.asarray(values)
+        indices = np.asarray(categories.indices)
+        order = np.argsort(indices)
+        position = np.clip(np.searchsorted(indices[order], values), 0, max(len(indices) - 1, 0))
+        classes = np.full(len(values), len(indices), dtype=np.int64)
+        if len(indices):
+            known = indices[order][position] == values
+            classes[known] = order[position[known]]
+        # categories without colors are all drawn in the no-data gray
+        colors = categories.colors or [np.multiply(NO_DATA_COLOR[:3], 255)] * len(indices)
+        names = [str(name) for name in categories.values]
+    elif colormap is not None and hasattr(colormap, "end_points"):
+        values = np.asarray(values, dtype=np.float64)
+        end_points = np.asarray(colormap.end_points, dtype=np.float64)
+        inclusive = np.asarray(colormap.end_inclusive, dtype=bool)
+        classes = np.sum((values[:, None] > end_points) | ((values[:, None] == end_points) & ~inclusive), axis=1)
+        classes[np.isnan(values)] = len(colormap.colors)
+        bounds = [-np.inf, *end_points, np.inf]
+        names = [f"{low:g} - {high:g}" for low, high in zip(bounds[:-1], bounds[1:])]
+        colors = colormap.colors
+    else:
+        raise ValueError(f"Attribute {attribute.name} has no discrete colormap or categories")
+    colors = np.concatenate([_rgba(np.asarray(colors, dtype=np.float32) / 255).reshape(-1, 4),
+                             np.asarray([NO_DATA_COLOR], dtype=np.float32)])
+    return classes.astype(np.int64), colors, [*names, "No data"]
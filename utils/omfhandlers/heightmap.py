@@ -0,0 +1,102 @@
+import numpy as np
+
+
+class HeightMap:
+    """Regular xy grid of surface elevations rasterized from a triangulated surface.
+
+    Grid nodes sit at ``origin + (i, j) * cell_size``. Every node inside a triangle
+    footprint gets the barycentric elevation of that triangle, overlapping triangles
+    keep the highest value. Nodes outside the surface are NaN.
+    """
+    # max number of (triangle, node) candidate pairs evaluated at once
+    chunk_size = 2 ** 22
+
+    def __init__(self, vertices, triangles, cell_size=None) -> None:
+        vertices = np.asarray(vertices, dtype=np.float64)
+        triangles = np.asarray(triangles, dtype=np.int64)
+        self.min_xy = vertices[:, :2].min(axis=0)
+        self.max_xy = vertices[:, :2].max(axis=0)
+        extent = self.max_xy - self.min_xy
+        if cell_size is None:
+            cell_size = np.sqrt(max(extent[0] * extent[1], 1e-12) / max(len(vertices), 1))
+        self.cell_size = float(cell_size)
+        self.shape = tuple((np.floor(extent / self.cell_size) + 2).astype(np.int64))
+        self.grid = self._rasterize(vertices, triangles)
+
+    def __str__(self):
+        return f'Instance of {__class__.__name__}, grid {self.shape[0]}x{self.shape[1]}, cell size {self.cell_size}'
+
+    def _rasterize(self, vertices, triangles):
+        nx, ny = self.shape
+        grid = np.full(nx * ny, -np.inf)
+
+        a, b, c = (vertices[triangles[:, n]] for n in range(3))
+        det = (b[:, 1] - c[:, 1]) * (a[:, 0] - c[:, 0]) + (c[:, 0] - b[:, 0]) * (a[:, 1] - c[:, 1])
+        # triangles seen edge-on from above have no footprint
+        keep = np.abs(det) > 1e-12
+        a, b, c, det = a[keep], b[keep], c[keep], det[keep]
+
+        corners = np.stack([a[:, :2], b[:, :2], c[:, :2]])
+        low = np.ceil((corners.min(axis=0) - self.min_xy) / self.cell_size).astype(np.int64)
+        high = np.floor((corners.max(axis=0) - self.min_xy) / self.cell_size).astype(np.int64)
+        low = np.maximum(low, 0)
+        high = np.minimum(high, np.array(self.shape) - 1)
+        span = np.maximum(high - low + 1, 0)
+        counts = span[:, 0] * span[:, 1]
+
+        ends = np.cumsum(counts)
+        start = 0
+        while start < len(counts):
+            stop = int(np.searchsorted(ends, ends[start] - counts[start] + self.chunk_size, side="right"))
+            stop = max(stop, start + 1)
+            chunk = slice(start, stop)
+            tri = np.repeat(np.arange(start, stop), counts[chunk])
+            local = np.arange(len(tri)) - np.repeat(ends[chunk] - counts[chunk] - (ends[start] - counts[start]),
+                                                    counts[chunk])
+            i = low[tri, 0] + local % span[tri, 0]
+            j = low[tri, 1] + local // span[tri, 0]
+            x = self.min_xy[0] + i * self.cell_size
+            y = self.min_xy[1] + j * self.cell_size
+
+            l1 = ((b[tri, 1] - c[tri, 1]) * (x - c[tri, 0]) + (c[tri, 0] - b[tri, 0]) * (y - c[tri, 1])) / det[tri]
+            l2 = ((c[tri, 1] - a[tri, 1]) * (x - c[tri, 0]) + (a[tri, 0] - c[tri, 0]) * (y - c[tri, 1])) / det[tri]
+            l3 = 1.0 - l1 - l2
+            eps = -1e-9
+            inside = (l1 >= eps) & (l2 >= eps) & (l3 >= eps)
+            z = l1 * a[tri, 2] + l2 * b[tri, 2] + l3 * c[tri, 2]
+            np.maximum.at(grid, (i + j * nx)[inside], z[inside])
+            start = stop
+
+        grid[np.isinf(grid)] = np.nan
+        return grid.reshape((nx, ny), order="F")
+
+    def elevation(self, x, y):
+        """Bilinear surface elevation under the xy points, NaN where there is no surface"""
+        fx = (np.asarray(x, dtype=np.float64) - self.min_xy[0]) / self.cell_size
+        fy = (np.asarray(y, dtype=np.float64) - self.min_xy[1]) / self.cell_size
+        nx, ny = self.shape
+        outside = (fx < 0) | (fy < 0) | (fx > nx - 1) | (fy > ny - 1)
+        i = np.clip(np.floor(fx), 0, nx - 2).astype(np.int64)
+        j = np.clip(np.floor(fy), 0, ny - 2).astype(np.int64)
+        tx = np.clip(fx - i, 0, 1)
+        ty = np.clip(fy - j, 0, 1)
+
+        values = np.stack([self.grid[i, j], self.grid[i + 1, j], self.grid[i, j + 1], self.grid[i + 1, j + 1]])
+        weights = np.stack([(1 - tx) * (1 - ty), tx * (1 - ty), (1 - tx) * ty, tx * ty])
+        # corners off the surface edge are dropped and the remaining weights renormalized
+        weights = np.where(np.isnan(values), 0.0, weights)
+        total = weights.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result = np.nansum(values * weights, axis=0) / total
+        result[(total == 0) | outside] = np.nan
+        return result
+
+    def is_above(self, x, y, z):
+        """True for points above the surface, points outside the surface are never above"""
+        with np.errstate(invalid="ignore"):
+            return np.asarray(z) > self.elevation(x, y)
+
+    def is_below(self, x, y, z):
+        """True for points below the surface, points outside the surface are never below"""
+        with np.errstate(invalid="ignore"):
+            return np.asarray(z) < self.elevation(x, y)
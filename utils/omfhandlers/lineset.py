@@ -1,7 +1,9 @@
 from pprint import pformat
 import numpy as np
 import utils.pygltf.tools as gltf
+import utils.pygltf.tiles as tiles
 import pandas as pd
+from .colormap import attribute_classes, attribute_colors, attribute_gradient
 
 
 class LinesHandler:
@@ -10,33 +12,190 @@ class LinesHandler:
         self.name = lines.name
         self.id_field = id_field
 
+    @property
+    def get_segments(self):
+        # segments are optional in OMF, without them vertices are connected in order
+        if self.lines.segments is None:
+            start = np.arange(len(self.lines.vertices.array) - 1)
+            segments = np.stack([start, start + 1], axis=1)
+            ids = next((np.asarray(attribute.array.array) for attribute in self.lines.attributes
+                        if attribute.name == self.id_field and attribute.location == "vertices"), None)
+            if ids is not None:
+                # consecutive vertices of different holes are not connected
+                segments = segments[ids[segments[:, 0]] == ids[segments[:, 1]]]
+            return segments
+        return self.lines.segments.array
+
     def lineset_to_pandas_dataframe(self):
+        """One row per segment with start/end coordinates and attributes
+
+        Segment attributes are copied as is, vertex attributes are taken at both
+        segment ends as <name>_start and <name>_end. Rows are grouped by id_field
+        keeping the segment order inside every group, 'from' and 'to' hold the
+        cumulative length along each group.
+        """
+        segments = self.get_segments
+        vertices = self.lines.vertices.array
+        start, end = vertices[segments[:, 0]], vertices[segments[:, 1]]
+
+        columns = {}
+        for attribute in self.lines.attributes:
+            values = np.asarray(attribute.array.array)
+            if attribute.location == "vertices":
+                columns[f"{attribute.name}_start"] = values[segments[:, 0]]
+                columns[f"{attribute.name}_end"] = values[segments[:, 1]]
+                if attribute.name == self.id_field:
+                    columns[attribute.name] = values[segments[:, 0]]
+            else:
+                columns[attribute.name] = values
+        for axis, name in enumerate("xyz"):
+            columns[f"{name}_start"] = start[:, axis]
+        for axis, name in enumerate("xyz"):
+            columns[f"{name}_end"] = end[:, axis]
+        columns["length"] = np.linalg.norm(end - start, axis=1)
+
+        if self.id_field is not None:
+            order = np.argsort(columns[self.id_field], kind="stable")
+            columns = {key: value[order] for key, value in columns.items()}
+            _, group_start, group_size = np.unique(columns[self.id_field], return_index=True, return_counts=True)
+            to = np.cumsum(columns["length"])
+            # restart the running length at the first segment of every group
+            to -= np.repeat(to[group_start] - columns["length"][group_start], group_size)
+            columns["from"] = to - columns["length"]
+            columns["from"][group_start] = 0.0
+            columns["to"] = to
 
-        lineset_df = pd.DataFrame()
+        return pd.DataFrame(columns)
 
+    def _get_attribute(self, name):
         for attribute in self.lines.attributes:
-            lineset_df[attribute.name] = attribute.array.array
-        offset = 0
-        for index in range(len(self.lines.vertices) - 1):
-
-            if index < len(lineset_df) - 1:
-
-                id = lineset_df.iloc[index][self.id_field]
-                next_id = lineset_df.iloc[index + 1][self.id_field]
-                if id != next_id:
-                    offset += 1
-
-                lineset_df.at[index, "x_start"] = self.lines.vertices[index + offset][0]
-                lineset_df.at[index, "y_start"] = self.lines.vertices[index + offset][1]
-                lineset_df.at[index, "z_start"] = self.lines.vertices[index + offset][2]
-                lineset_df.at[index, "x_end"] = self.lines.vertices[index + 1 + offset][0]
-                lineset_df.at[index, "y_end"] = self.lines.vertices[index + 1 + offset][1]
-                lineset_df.at[index, "z_end"] = self.lines.vertices[index + 1 + offset][2]
-        lineset_df.at[len(lineset_df) - 1, "x_start"] = self.lines.vertices[-2][0]
-        lineset_df.at[len(lineset_df) - 1, "y_start"] = self.lines.vertices[-2][1]
-        lineset_df.at[len(lineset_df) - 1, "z_start"] = self.lines.vertices[-2][2]
-        lineset_df.at[len(lineset_df) - 1, "x_end"] = self.lines.vertices[-1][0]
-        lineset_df.at[len(lineset_df) - 1, "y_end"] = self.lines.vertices[-1][1]
-        lineset_df.at[len(lineset_df) - 1, "z_end"] = self.lines.vertices[-1][2]
-
-        return lineset_df
\ No newline at end of file
+            if attribute.name == name:
+                return attribute
+        raise KeyError(f"LineSet {self.name} has no attribute {name}")
+
+    def _prepare_gltf_data(self, color_attribute=None, mode="LINES", limits=None, attributes=None, encoding="float32",
+                           colormap_texture=False, material_per_class=False):
+        segments = self.get_segments
+        vertices = self.lines.vertices.array
+        attribute = None if color_attribute is None else self._get_attribute(color_attribute)
+        custom_attributes = [self._get_attribute(name) for name in attributes or []]
+        # with a material per class the color attribute does not end up in the vertices
+        colored = [] if attribute is None or material_per_class else [attribute]
+        on_segments = any(item.location == "segments" for item in [*colored, *custom_attributes])
+        index_ranges = None
+
+        # every output vertex takes vertex values from vertex_source and segment values from segment_source
+        if mode == "LINE_STRIP":
+            # a run continues while a segment starts where the previous one ended
+            run_start = np.flatnonzero(np.r_[True, segments[1:, 0] != segments[:-1, 1]])
+            run_size = np.diff(np.r_[run_start, len(segments)])
+            indexes = np.insert(segments[:, 1], run_start, segments[run_start, 0])
+            index_ranges = np.stack([run_start + np.arange(len(run_start)), run_size + 1], axis=1)
+            vertex_source = np.arange(len(vertices))
+            segment_source = np.zeros(len(vertices), dtype=np.int64)
+            segment_source[segments[:, 1]] = np.arange(len(segments))
+            segment_source[segments[run_start, 0]] = run_start
+        elif on_segments:
+            # every segment gets its own pair of vertices so values do not blend between segments
+            vertex_source = segments.ravel()
+            segment_source = np.repeat(np.arange(len(segments)), 2)
+            indexes = np.arange(len(vertex_source))
+        else:
+            vertex_source = np.arange(len(vertices))
+            segment_source = None
+            indexes = segments.ravel()
+
+        def per_vertex(item, values):
+            return values[segment_source] if item.location == "segments" else values[vertex_source]
+
+        vertex_data = np.zeros(len(vertex_source), dtype=[
+            ("position", np.float32, 3),
+            ("color", np.float32, 4),
+        ])
+        vertex_data["position"] = vertices[vertex_source]
+        extras = None
+        custom = {}
+        if custom_attributes:
+            custom, extras = gltf.encode_custom_attributes(
+                {item.name: per_vertex(item, np.asarray(item.array.array)) for item in custom_attributes}, encoding)
+        if colormap_texture:
+            # normalized value as texture coordinate into the colormap image replaces the vertex color
+            _, limits = attribute_gradient(attribute, limits)
+            custom["texCoord0"] = per_vertex(attribute, gltf.colormap_texcoords(attribute.array.array, limits))
+        if colormap_texture or material_per_class:
+            vertex_data = gltf.extend_vertex_data(vertex_data, custom, exclude=("color",))
+        else:
+            vertex_data["color"] = (1, 1, 0, 1) if attribute is None else \
+                per_vertex(attribute, attribute_colors(attribute, limits))
+            if custom:
+                vertex_data = gltf.extend_vertex_data(vertex_data, custom)
+        index_data = np.asarray(indexes, dtype=gltf.index_dtype(len(vertex_data)))
+        return vertex_data, index_data, index_ranges, extras
+
+    def gltf_mesh_data(self, color_attribute=None, mode="LINES", limits=None, attributes=None, encoding="float32",
+                       colormap_texture=False, material_per_class=False):
+        """Vertex and index arrays of the lines with what numpy_to_gltf and add_mesh_materials need
+
+        Options as in create_gltf_from_lineset.
+        """
+        if mode not in ("LINES", "LINE_STRIP"):
+            raise ValueError("mode must be 'LINES' or 'LINE_STRIP'")
+        if colormap_texture and color_attribute is None:
+            raise ValueError("colormap_texture needs a color_attribute")
+        if material_per_class and (color_attribute is None or mode != "LINES"):
+            raise ValueError("material_per_class needs a color_attribute and LINES mode")
+        if colormap_texture and material_per_class:
+            raise ValueError("colormap_texture and material_per_class are exclusive")
+        vertex_data, index_data, index_ranges, extras = self._prepare_gltf_data(color_attribute, mode, limits,
+                                                                                attributes, encoding,
+                                                                                colormap_texture,
+                                                                                material_per_class)
+        mesh_data = {"vertex_data": vertex_data, "index_data": index_data, "mode": mode,
+                     "index_ranges": index_ranges, "attribute_extras": extras}
+        if material_per_class:
+            attribute = self._get_attribute(color_attribute)
+            classes, colors, names = attribute_classes(attribute)
+            if attribute.location == "vertices":
+                classes = classes[self.get_segments[:, 0]]
+            index_data, index_ranges, present = gltf.group_by_class(index_data, classes)
+            mesh_data.update(index_data=index_data, index_ranges=index_ranges, class_colors=colors[present],
+                             class_names=[names[n] for n in present])
+        if colormap_texture:
+            mesh_data["gradient"], _ = attribute_gradient(self._get_attribute(color_attribute), limits)
+        return mesh_data
+
+    def create_gltf_from_lineset(self, location, color_attribute=None, mode="LINES", limits=None, binary=False,
+                                 attributes=None, encoding="float32", colormap_texture=False,
+                                 material_per_class=False):
+        """Export segments as LINES, or as one LINE_STRIP primitive per connected run (e.g. per hole)
+
+        color_attribute may be located on vertices or segments, its values go through
+        the attribute colormap (limits override the colormap or data range).
+        attributes are added as custom vertex attributes, see
+        BlockModelHandler.create_gltf_from_dataframe for the encodings.
+        With colormap_texture the color_attribute is written as TEXCOORD_0 into a 1D colormap
+        image saved as <location>_colormap.png.
+        With material_per_class the segments of a Discrete or Category color_attribute are
+        grouped into one LINES primitive per class with its own base color material
+        (segments take the class of their first vertex for vertex attributes), no COLOR_0.
+        """
+        mesh_data = self.gltf_mesh_data(color_attribute, mode, limits, attributes, encoding, colormap_texture,
+                                        material_per_class)
+        gltf_path = f"{location}.gltf"
+        bin_path = f"{location}.bin"
+
+        document, buffers = gltf.numpy_mesh_to_gltf(mesh_data, gltf_path, bin_path)
+        gltf.add_mesh_materials(location, document, mesh_data)
+
+        if binary:
+            gltf.save_glb(f"{location}.glb", document, buffers)
+        else:
+            gltf.save(gltf_path, bin_path, document, buffers)
+
+    def create_tileset(self, location, max_items=2 ** 16, max_depth=8, quadtree=False, **options):
+        """Export the segments as GLB tiles under the location directory with a tileset.json index
+
+        Segments are split by an octree (quadtree=True: x and y only) until a tile holds at
+        most max_items of them, see tiles.save_tileset. options as in gltf_mesh_data, LINES mode only.
+        """
+        return tiles.save_tileset(location, self.gltf_mesh_data(**options), max_items, max_depth, quadtree)
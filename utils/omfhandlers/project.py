@@ -0,0 +1,135 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pprint import pformat
+import numpy as np
+import utils.pygltf.tools as gltf
+from utils.pygltf import gltf2
+from .blockmodel import BlockModelHandler
+from .surface import SurfaceHandler
+from .lineset import LinesHandler
+
+
+logger = logging.getLogger(__name__)
+
+COMPOSITE_SCHEMA = "org.omf.v2.composite"
+HANDLER_BY_SCHEMA = {
+    "org.omf.v2.element.blockmodel.tensorgrid": BlockModelHandler,
+    "org.omf.v2.element.surface": SurfaceHandler,
+    "org.omf.v2.element.surfacetensorgrid": SurfaceHandler,
+    "org.omf.v2.element.lineset": LinesHandler,
+}
+
+
+class ProjectHandler:
+    """Every element of an OMF project, Composite children included, in one glTF scene"""
+
+    def __init__(self, project) -> None:
+        self.project = project
+        self.name = project.name
+
+    def __str__(self):
+        return "\nProject info:\n\n" + \
+            f'Instance of {__class__.__name__}\n' + \
+            pformat(self.get_project_elements, depth=3, indent=1, compact=True, width=250)
+
+    @property
+    def get_project_elements(self) -> list:
+        """(name, schema) of every element, Composite children follow their parent"""
+        return [(element.name, element.schema) for element, _ in self._walk(self.project.elements)]
+
+    def _walk(self, elements, parent=None):
+        for element in elements:
+            yield element, parent
+            if element.schema == COMPOSITE_SCHEMA:
+                yield from self._walk(element.elements, element)
+
+    @staticmethod
+    def get_handler(element):
+        """Handler of the element, None for schemas without one (point sets, sub-blocked models)
+
+        Block models are colored by the color_attribute of their options, CU_pct by default,
+        and exported with the default material when they have neither.
+        """
+        handler = HANDLER_BY_SCHEMA.get(element.schema)
+        if handler is LinesHandler:
+            return LinesHandler(element, None)
+        return None if handler is None else handler(element)
+
+    def create_gltf_from_project(self, location, binary=False, max_workers=None, handlers=None, options=None):
+        """Export all elements into one document with a single shared binary buffer
+
+        Every element becomes a node with its own mesh, Composite elements become nodes
+        holding their children. Element handlers and geometry are built in parallel threads, max_workers
+        as in ThreadPoolExecutor. handlers, {element name: handler}, replaces the default
+        handler of an element (e.g. a filtered or compact BlockModelHandler), options,
+        {element name: dict}, are keyword arguments of that handler gltf_mesh_data.
+        Returns the names of the elements that were skipped for lack of a handler, each one
+        is also logged as a warning.
+        """
+        handlers = handlers or {}
+        options = options or {}
+        walked = list(self._walk(self.project.elements))
+        leaves = [element for element, _ in walked if element.schema != COMPOSITE_SCHEMA]
+
+        def build(element):
+            # handlers are built in the threads too, a block model handler builds its dataframe
+            handler = handlers.get(element.name) or self.get_handler(element)
+            return handler, None if handler is None else handler.gltf_mesh_data(**options.get(element.name, {}))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(build, element) for element in leaves]
+        try:
+            built = dict(zip(map(id, leaves), (future.result() for future in futures)))
+            return self._write_gltf(location, binary, walked, built)
+        finally:
+            for future in futures:
+                data = None if future.exception() else future.result()[1]
+                if data is not None and "builder" in data:
+                    data["builder"].close()
+
+    def _write_gltf(self, location, binary, walked, built):
+        gltf_path = f"{location}.gltf"
+        bin_path = f"{location}.bin"
+        document = gltf2.Document()
+        buffers = []
+        buffer = gltf2.Buffer(0, uri=os.path.relpath(bin_path, os.path.dirname(gltf_path)), name="Project Buffer")
+        document.add_buffer(buffer)
+
+        nodes = {}
+        skipped = []
+        roots = []
+        for element, parent in walked:
+            node = gltf2.Node(name=element.name)
+            if element.schema != COMPOSITE_SCHEMA:
+                handler, data = built[id(element)]
+                if data is None:
+                    logger.warning("Element %s (%s) has no glTF handler and is left out of %s",
+                                   element.name, element.schema, location)
+                    skipped.append(element.name)
+                    continue
+                node.mesh = gltf.add_mesh(document, buffer, buffers, data["vertex_data"], data["index_data"],
+                                          data.get("mode", "TRIANGLES"),
+                                          data.get("index_ranges"), data.get("bounds"),
+                                          data.get("attribute_extras"), name=element.name)
+                gltf.add_mesh_materials(f"{location}_{len(document.meshes) - 1}", document, data, mesh=node.mesh)
+                origin = getattr(element, "origin", None)
+                # block coordinates already include the origin, other geometry is relative to it
+                if not isinstance(handler, BlockModelHandler) and origin is not None and np.any(origin):
+                    node.translation = [float(value) for value in origin]
+            document.add_node(node)
+            nodes[id(element)] = node
+            if parent is None:
+                roots.append(node)
+            else:
+                nodes[id(parent)].children.append(node)
+        buffer.byteLength = gltf.byteLength(buffers) or 0
+
+        scene = gltf2.Scene(name=self.name or "Default Scene", nodes=roots)
+        document.add_scene(scene)
+        document.scene = scene
+        if binary:
+            gltf.save_glb(f"{location}.glb", document, buffers)
+        else:
+            gltf.save(gltf_path, bin_path, document, buffers)
+        return skipped
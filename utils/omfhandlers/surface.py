@@ -1,14 +1,19 @@
 from pprint import pformat
 import numpy as np
 import utils.pygltf.tools as gltf
+import utils.pygltf.tiles as tiles
+from .heightmap import HeightMap
+from .bvh import TriangleBVH
+from .colormap import attribute_classes, attribute_colors, attribute_gradient
 
 
 class SurfaceHandler:
     def __init__(self, surface) -> None:
         self.surface = surface
         self.name = surface.name
-        self.geometry = {"vertices": self.surface.vertices.array,
-                         "triangles": self.surface.triangles.array}
+        self.geometry = self._surface_geometry()
+        self._heightmaps = {}
+        self._bvh = None
 
     def __str__(self):
         return "\nSurface info:\n\n" + \
@@ -27,6 +32,60 @@ class SurfaceHandler:
     def get_surface_origin(self):
         return self.get_surface_info.get("center", self.surface.origin)
 
+    def _surface_geometry(self):
+        if hasattr(self.surface, "triangles"):
+            return {"vertices": self.surface.vertices.array,
+                    "triangles": self.surface.triangles.array}
+
+        # TensorGridSurface: nodes run along u first, offset_w lifts them along the grid normal
+        u = np.cumsum(np.insert(np.asarray(self.surface.tensor_u, dtype=np.float64), 0, 0))
+        v = np.cumsum(np.insert(np.asarray(self.surface.tensor_v, dtype=np.float64), 0, 0))
+        uu, vv = np.meshgrid(u, v, indexing="ij")
+        uu, vv = uu.ravel(order="F"), vv.ravel(order="F")
+        axis_u = np.asarray(self.surface.axis_u, dtype=np.float64)
+        axis_v = np.asarray(self.surface.axis_v, dtype=np.float64)
+        vertices = uu[:, None] * axis_u + vv[:, None] * axis_v
+        if self.surface.offset_w is not None:
+            vertices += self.surface.offset_w.array[:, None] * np.cross(axis_u, axis_v)
+
+        nu, nv = len(u), len(v)
+        i, j = np.meshgrid(np.arange(nu - 1), np.arange(nv - 1), indexing="ij")
+        n0 = (i + j * nu).ravel(order="F")
+        n1, n2, n3 = n0 + 1, n0 + nu, n0 + nu + 1
+        triangles = np.stack([np.stack([n0, n1, n3], axis=1), np.stack([n0, n3, n2], axis=1)], axis=1).reshape(-1, 3)
+        return {"vertices": vertices, "triangles": triangles}
+
+    def get_heightmap(self, cell_size=None) -> HeightMap:
+        """Surface rasterized into a height grid, built once per cell size and cached"""
+        if cell_size not in self._heightmaps:
+            vertices = self.geometry["vertices"] + np.asarray(self.surface.origin, dtype=np.float64)
+            self._heightmaps[cell_size] = HeightMap(vertices, self.geometry["triangles"], cell_size)
+        return self._heightmaps[cell_size]
+
+    def get_bvh(self, cache_path=None) -> TriangleBVH:
+        """Triangle BVH of the surface, optionally persisted to cache_path (e.g. next to the .omf file)
+
+        A cached tree is reused only if it was built for the same geometry.
+        """
+        if self._bvh is None:
+            vertices = self.geometry["vertices"] + np.asarray(self.surface.origin, dtype=np.float64)
+            if cache_path is not None:
+                self._bvh = TriangleBVH.load(cache_path, vertices, self.geometry["triangles"])
+            if self._bvh is None:
+                self._bvh = TriangleBVH(vertices, self.geometry["triangles"])
+                if cache_path is not None:
+                    self._bvh.save(cache_path)
+        return self._bvh
+
+    def get_elevation(self, x, y, cell_size=None):
+        return self.get_heightmap(cell_size).elevation(x, y)
+
+    def is_above_surface(self, x, y, z, cell_size=None):
+        return self.get_heightmap(cell_size).is_above(x, y, z)
+
+    def is_below_surface(self, x, y, z, cell_size=None):
+        return self.get_heightmap(cell_size).is_below(x, y, z)
+
     def _prepare_gltf_data(self):
         vertexes = self.geometry["vertices"]
         indexes = self.geometry["triangles"].ravel()
@@ -42,7 +101,7 @@ class SurfaceHandler:
 
         vertex_data["position"] = vertexes
         vertex_data["normal"] = normals
-        index_data = np.array(indexes, dtype=np.uint16)
+        index_data = np.array(indexes, dtype=gltf.index_dtype(buffer_array_size))
         # color = self.set_color(color_attribute)
         # TODO: set up coloring
         vertex_data["color"] = [(1, 1, 0, 1)] * buffer_array_size
@@ -69,16 +128,118 @@ class SurfaceHandler:
     #     index_data = np.array(indexes, dtype=np.uint16)
     #     return vertex_data, index_data
 
-    def create_gltf_from_dataset(self, location):
+    def _get_attribute(self, name):
+        for attribute in self.surface.attributes:
+            if attribute.name == name:
+                return attribute
+        raise KeyError(f"Surface {self.name} has no attribute {name}")
 
+    @staticmethod
+    def _per_vertex(attribute, values, corners):
+        if attribute.location == "faces":
+            # TensorGridSurface faces are split into two triangles
+            return np.repeat(values, len(corners) // len(values), axis=0)
+        return values if corners is None else values[corners]
+
+    def _add_vertex_values(self, vertex_data, index_data, attributes, encoding, color_attribute, limits,
+                           colormap_texture, material_per_class=False):
+        attributes = [self._get_attribute(name) for name in attributes or []]
+        color = None if color_attribute is None else self._get_attribute(color_attribute)
+        # with a material per class the color attribute does not end up in the vertices
+        colored = [] if color is None or material_per_class else [color]
+        corners = None
+        if any(attribute.location == "faces" for attribute in [*attributes, *colored]):
+            # face values need their own corners, every triangle gets three unshared vertices
+            corners = index_data.astype(np.int64)
+            vertex_data = vertex_data[corners]
+            index_data = np.arange(len(corners), dtype=gltf.index_dtype(len(corners)))
+
+        custom, extras = gltf.encode_custom_attributes(
+            {attribute.name: self._per_vertex(attribute, np.asarray(attribute.array.array), corners)
+             for attribute in attributes}, encoding)
+        exclude = ()
+        if color is not None and colormap_texture:
+            # normalized value as texture coordinate into the colormap image replaces the vertex color
+            _, limits = attribute_gradient(color, limits)
+            custom["texCoord0"] = self._per_vertex(color, gltf.colormap_texcoords(color.array.array, limits), corners)
+            exclude = ("color",)
+        elif material_per_class:
+            exclude = ("color",)
+        elif color is not None:
+            vertex_data["color"] = self._per_vertex(color, attribute_colors(color, limits), corners)
+        if custom or exclude:
+            vertex_data = gltf.extend_vertex_data(vertex_data, custom, exclude=exclude)
+        return vertex_data, index_data, extras
+
+    def gltf_mesh_data(self, weld=False, tolerance=None, attributes=None, encoding="float32", color_attribute=None,
+                       limits=None, colormap_texture=False, material_per_class=False):
+        """Vertex and index arrays of the surface with what numpy_to_gltf and add_mesh_materials need
+
+        Options as in create_gltf_from_dataset.
+        """
+        if (colormap_texture or material_per_class) and color_attribute is None:
+            raise ValueError("colormap_texture and material_per_class need a color_attribute")
+        if colormap_texture and material_per_class:
+            raise ValueError("colormap_texture and material_per_class are exclusive")
         vertex_data, index_data = self._prepare_gltf_data()
+        if material_per_class:
+            attribute = self._get_attribute(color_attribute)
+            classes, colors, names = attribute_classes(attribute)
+            if attribute.location == "vertices":
+                classes = classes[index_data[0::3]]
+            else:
+                # TensorGridSurface faces are split into two triangles
+                classes = np.repeat(classes, len(index_data) // 3 // len(classes))
+        extras = None
+        if attributes or color_attribute:
+            vertex_data, index_data, extras = self._add_vertex_values(vertex_data, index_data, attributes, encoding,
+                                                                      color_attribute, limits, colormap_texture,
+                                                                      material_per_class)
+        if weld:
+            fields = [name for name in vertex_data.dtype.names if name != "normal"]
+            vertex_data, index_data = gltf.weld_vertices(vertex_data, index_data, fields=fields, tolerance=tolerance)
 
+        mesh_data = {"vertex_data": vertex_data, "index_data": index_data, "attribute_extras": extras}
+        if material_per_class:
+            index_data, index_ranges, present = gltf.group_by_class(index_data, classes)
+            mesh_data.update(index_data=index_data, index_ranges=index_ranges, class_colors=colors[present],
+                             class_names=[names[n] for n in present])
+        if colormap_texture:
+            mesh_data["gradient"], _ = attribute_gradient(self._get_attribute(color_attribute), limits)
+        return mesh_data
+
+    def create_gltf_from_dataset(self, location, weld=False, tolerance=None, binary=False, attributes=None,
+                                 encoding="float32", color_attribute=None, limits=None, colormap_texture=False,
+                                 material_per_class=False):
+        """Export the surface, attributes (names of surface attributes) are added as custom vertex attributes
+
+        See BlockModelHandler.create_gltf_from_dataframe for the encodings. color_attribute is
+        colored through its colormap (limits override the colormap or data range), with
+        colormap_texture it is written as TEXCOORD_0 into <location>_colormap.png instead.
+        With material_per_class the faces of a Discrete or Category color_attribute are grouped
+        into one primitive per class with its own base color material and no COLOR_0
+        (faces take the class of their first vertex for vertex attributes).
+        """
+        mesh_data = self.gltf_mesh_data(weld, tolerance, attributes, encoding, color_attribute, limits,
+                                        colormap_texture, material_per_class)
         gltf_path = f"{location}.gltf"
         bin_path = f"{location}.bin"
 
-        document, buffers = gltf.numpy_to_gltf(vertex_data, index_data, gltf_path, bin_path)
+        document, buffers = gltf.numpy_mesh_to_gltf(mesh_data, gltf_path, bin_path)
+        gltf.add_mesh_materials(location, document, mesh_data)
+
+        if binary:
+            gltf.save_glb(f"{location}.glb", document, buffers)
+        else:
+            gltf.save(gltf_path, bin_path, document, buffers)
+
+    def create_tileset(self, location, max_items=2 ** 16, max_depth=8, quadtree=True, **options):
+        """Export the surface as GLB tiles under the location directory with a tileset.json index
 
-        gltf.save(gltf_path, bin_path, document, buffers)
+        Triangles are split by a quadtree (octree with quadtree=False) until a tile holds at
+        most max_items of them, see tiles.save_tileset. options as in gltf_mesh_data.
+        """
+        return tiles.save_tileset(location, self.gltf_mesh_data(**options), max_items, max_depth, quadtree)
 
     @property
     def get_surface_extends(self) -> dict:
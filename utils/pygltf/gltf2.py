@@ -156,6 +156,8 @@ class Document(object):
         self.skins        = []
         self.textures     = []
         self.scene        = kwargs.get('scene', None)
+        self.extensionsUsed     = kwargs.get('extensionsUsed', [])
+        self.extensionsRequired = kwargs.get('extensionsRequired', [])
         
         self.add_accessors(kwargs.get('accessors', []))
         self.add_animations(kwargs.get('animations', []))
@@ -254,6 +256,10 @@ class Document(object):
     def togltf(self):
         result = {}
         result["asset"] = self.asset
+        if self.extensionsUsed:
+            result["extensionsUsed"] = self.extensionsUsed
+        if self.extensionsRequired:
+            result["extensionsRequired"] = self.extensionsRequired
         if self.buffers:
             result["buffers"]     = [buffer.togltf()      for buffer      in self.buffers]
         if self.bufferViews:
@@ -302,12 +308,15 @@ class Accessor(Object):
         self.sparse = kwargs.get("sparse")
     def togltf(self):
         result = super().togltf()
-        result["bufferView"] = self.bufferView
+        if self.bufferView is not None:
+            result["bufferView"] = self.bufferView
         result["componentType"] = self.componentType.value
         result["count"] = self.count
         result["type"] = self.type.value
         if self.byteOffset is not None:
             result["byteOffset"] = self.byteOffset
+        if self.normalized:
+            result["normalized"] = self.normalized
         if self.max:
             result["max"] = self.max
         if self.min:
@@ -563,9 +572,9 @@ class PBRMetallicRoughness(object):
             result["baseColorFactor"] = self.baseColorFactor
         if self.baseColorTexture:
             result["baseColorTexture"] = self.baseColorTexture.togltf()
-        if self.metallicFactor:
+        if self.metallicFactor is not None:
             result["metallicFactor"] = self.metallicFactor
-        if self.roughnessFactor:
+        if self.roughnessFactor is not None:
             result["roughnessFactor"] = self.roughnessFactor
         if self.metallicRoughnessTexture:
             result["metallicRoughnessTexture"] = self.metallicRoughnessTexture.togltf()
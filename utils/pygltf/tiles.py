@@ -0,0 +1,153 @@
+import os
+import json
+import numpy as np
+from . import tools
+
+# TRIANGLES and LINES items can be split between tiles, strips and fans cannot
+INDICES_PER_ITEM = {"TRIANGLES": 3, "LINES": 2}
+
+
+def _tileset(geometric_error, root):
+    # 3D Tiles 1.0 keeps the glTF content in the OMF axes with gltfUpAxis,
+    # GLB content needs 3DTILES_content_gltf there
+    return {"asset": {"version": "1.0", "gltfUpAxis": "Z"},
+            "extensionsUsed": ["3DTILES_content_gltf"], "extensionsRequired": ["3DTILES_content_gltf"],
+            "geometricError": geometric_error, "root": root}
+
+
+def _mode_name(mode):
+    return mode if isinstance(mode, str) else mode.name
+
+
+def item_centroids(mesh_data):
+    """Centroid of every triangle or segment of a handler mesh data dict"""
+    per_item = INDICES_PER_ITEM.get(_mode_name(mesh_data.get("mode", "TRIANGLES")))
+    if per_item is None:
+        raise ValueError("Only TRIANGLES and LINES meshes can be tiled")
+    positions = mesh_data["vertex_data"]["position"]
+    items = np.asarray(mesh_data["index_data"]).reshape(-1, per_item)
+    return positions[items].astype(np.float64).mean(axis=1)
+
+
+def split_items(centroids, items, max_items, max_depth, quadtree=False, depth=0):
+    """Octree (quadtree: x and y only) over the item centroids
+
+    Returns nested {"items": item numbers for leaves, "children": [...]} dicts, a node is
+    split in its bounding box center while it holds more than max_items and depth < max_depth.
+    """
+    if len(items) <= max_items or depth >= max_depth:
+        return {"items": items, "children": []}
+    points = centroids[items]
+    center = (points.min(axis=0) + points.max(axis=0)) / 2
+    axes = 2 if quadtree else 3
+    octant = ((points[:, :axes] > center[:axes]) * (1 << np.arange(axes))).sum(axis=1)
+    if np.all(octant == octant[0]):
+        # coincident centroids cannot be separated
+        return {"items": items, "children": []}
+    order = np.argsort(octant, kind="stable")
+    counts = np.bincount(octant, minlength=1 << axes)
+    children = [split_items(centroids, part, max_items, max_depth, quadtree, depth + 1)
+                for part in np.split(items[order], np.cumsum(counts)[:-1]) if len(part)]
+    return {"items": None, "children": children}
+
+
+def tile_mesh_data(mesh_data, items):
+    """Mesh data dict with only the given triangles or segments, vertices renumbered"""
+    mode = _mode_name(mesh_data.get("mode", "TRIANGLES"))
+    per_item = INDICES_PER_ITEM[mode]
+    items = np.sort(items)
+    indices = np.asarray(mesh_data["index_data"]).reshape(-1, per_item)[items]
+    used, remapped = np.unique(indices, return_inverse=True)
+    tile = {"vertex_data": mesh_data["vertex_data"][used],
+            "index_data": remapped.reshape(-1).astype(tools.index_dtype(len(used))),
+            "mode": mode, "attribute_extras": mesh_data.get("attribute_extras")}
+    index_ranges = mesh_data.get("index_ranges")
+    if index_ranges is not None:
+        # items keep their order, so every primitive range stays contiguous inside the tile
+        first_items = np.asarray(index_ranges)[:, 0] // per_item
+        primitives = np.searchsorted(first_items, items, side="right") - 1
+        tile["index_ranges"], present = tools.class_ranges(primitives, per_item)
+        if "class_colors" in mesh_data:
+            tile["class_colors"] = np.asarray(mesh_data["class_colors"])[present]
+            tile["class_names"] = [mesh_data["class_names"][n] for n in present]
+    return tile
+
+
+def bounding_box(positions):
+    """3D Tiles box bounding volume: center followed by the three half axes"""
+    low, high = positions.min(axis=0).astype(np.float64), positions.max(axis=0).astype(np.float64)
+    center, half = (low + high) / 2, (high - low) / 2
+    return [*center.tolist(), half[0], 0, 0, 0, half[1], 0, 0, 0, half[2]], low, high
+
+
+def save_tileset(location, mesh_data, max_items=2 ** 16, max_depth=8, quadtree=False):
+    """Write the mesh as spatial tiles: <location>/tileset.json and one GLB per leaf tile
+
+    Leaf tiles hold the triangles or segments whose centroid falls in them, parent tiles
+    have no content and a geometric error of their box diagonal, children are added
+    ("ADD" refinement) as the viewer gets closer. Parents only split the data spatially,
+    nothing is drawn in a region until its leaves load: coarse overview levels come from
+    save_lod_tileset (BlockModelHandler.create_lod_tileset). The layout follows 3D Tiles
+    1.0 with glTF content kept in the OMF axes (gltfUpAxis Z), every file is static.
+    """
+    os.makedirs(location, exist_ok=True)
+    centroids = item_centroids(mesh_data)
+    tree = split_items(centroids, np.arange(len(centroids)), max_items, max_depth, quadtree)
+    colormap_uri = None
+    if "gradient" in mesh_data:
+        colormap_uri = "colormap.png"
+        tools.write_png(os.path.join(location, colormap_uri), tools.colormap_texels(mesh_data["gradient"])[None])
+
+    def write(node, name):
+        if node["items"] is not None:
+            tile = tile_mesh_data(mesh_data, node["items"])
+            document, buffers = tools.numpy_mesh_to_gltf(tile, os.path.join(location, f"{name}.gltf"),
+                                                         os.path.join(location, f"{name}.bin"))
+            if colormap_uri is not None:
+                tools.add_colormap_material(document, colormap_uri)
+            tools.add_mesh_materials(location, document, {key: value for key, value in tile.items()
+                                                          if key != "gradient"})
+            tools.save_glb(os.path.join(location, f"{name}.glb"), document, buffers)
+            box, low, high = bounding_box(tile["vertex_data"]["position"])
+            return {"boundingVolume": {"box": box}, "geometricError": 0, "content": {"uri": f"{name}.glb"}}, \
+                low, high
+        children = [write(child, f"{name}_{number}") for number, child in enumerate(node["children"])]
+        low = np.min([child[1] for child in children], axis=0)
+        high = np.max([child[2] for child in children], axis=0)
+        box, _, _ = bounding_box(np.stack([low, high]))
+        return {"boundingVolume": {"box": box}, "geometricError": float(np.linalg.norm(high - low)),
+                "refine": "ADD", "children": [child[0] for child in children]}, low, high
+
+    root, _, _ = write(tree, "tile")
+    root["refine"] = "ADD"
+    tileset = _tileset(root["geometricError"], root)
+    with open(os.path.join(location, "tileset.json"), "w") as f:
+        json.dump(tileset, f, indent=2)
+    return tileset
+
+
+def save_lod_tileset(location, levels, errors):
+    """Write levels of detail, finest first, as a chain of tiles: <location>/tileset.json and lod<n>.glb
+
+    errors[n] is the geometric error of level n (0 for the finest). The coarsest level is the
+    root and every finer level replaces its parent. levels may be any iterable, every level
+    is written before the next one is taken.
+    """
+    os.makedirs(location, exist_ok=True)
+    tile = None
+    for level, mesh_data in enumerate(levels):
+        name = f"lod{level}"
+        document, buffers = tools.numpy_mesh_to_gltf(mesh_data, os.path.join(location, f"{name}.gltf"),
+                                                     os.path.join(location, f"{name}.bin"))
+        tools.add_mesh_materials(os.path.join(location, name), document, mesh_data)
+        tools.save_glb(os.path.join(location, f"{name}.glb"), document, buffers)
+        box, _, _ = bounding_box(mesh_data["vertex_data"]["position"])
+        parent = {"boundingVolume": {"box": box}, "geometricError": float(errors[level]),
+                  "refine": "REPLACE", "content": {"uri": f"{name}.glb"}}
+        if tile is not None:
+            parent["children"] = [tile]
+        tile = parent
+    tileset = _tileset(float(errors[-1]) * 2, tile)
+    with open(os.path.join(location, "tileset.json"), "w") as f:
+        json.dump(tileset, f, indent=2)
+    return tileset
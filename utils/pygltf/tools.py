@@ -1,8 +1,22 @@
 import os
+import re
 import json
+import zlib
+import struct
+import base64
+from urllib.parse import unquote
 import numpy as np
 from . import gltf2 as gltf
 
+GLB_MAGIC = b"glTF"
+GLB_VERSION = 2
+GLB_CHUNK_JSON = 0x4E4F534A
+GLB_CHUNK_BIN = 0x004E4942
+# header and chunk lengths are uint32
+GLB_MAX_LENGTH = 0xFFFFFFFF
+
+CUSTOM_ATTRIBUTE_ENCODINGS = ("float32", "float16", "uint16")
+
 ATTRIBUTE_BY_NAME = {
     "position": gltf.Attribute.POSITION,
     "normal": gltf.Attribute.NORMAL,
@@ -49,7 +63,8 @@ def subtype(dtype):
         return dtype, shape
 
 
-def generate_structured_array_accessors(data, buffer_number, offset=None, count=None, name=None):
+def generate_structured_array_accessors(data, buffer_number, offset=None, count=None, name=None, bounds=None,
+                                        extras=None):
     name = "{key}" if name is None else name
     count = len(data) if count is None else count
     
@@ -57,13 +72,24 @@ def generate_structured_array_accessors(data, buffer_number, offset=None, count=
     for key, value in data.dtype.fields.items():
         dtype, delta = value
         dtype, shape = subtype(dtype)
-        print(delta)
         accessorType, componentType = from_np_type(dtype, shape)
         accessor = gltf.Accessor(buffer_number, delta, count, accessorType, componentType, name=name.format(key=key))
         attribute = ATTRIBUTE_BY_NAME.get(key)
+        if attribute is None and key.startswith("_"):
+            # application specific attributes must start with an underscore
+            attribute = gltf.Attribute.custom(key)
+        if extras is not None and key in extras:
+            accessor.extras = extras[key]
+        if attribute in (gltf.Attribute.TEXCOORD_0, gltf.Attribute.TEXCOORD_1, gltf.Attribute.COLOR_0) \
+                and componentType != gltf.ComponentType.FLOAT:
+            # integer texture coordinates and colors are only valid as normalized values
+            accessor.normalized = True
         if attribute == gltf.Attribute.POSITION:
-            accessor.max = np.amax(data[key], axis=0).tolist()
-            accessor.min = np.amin(data[key], axis=0).tolist()
+            if bounds is not None and key in bounds:
+                accessor.min, accessor.max = (np.asarray(bound).tolist() for bound in bounds[key])
+            else:
+                accessor.max = np.amax(data[key], axis=0).tolist()
+                accessor.min = np.amin(data[key], axis=0).tolist()
         result[attribute] = accessor
     return result
 
@@ -85,7 +111,6 @@ def generate_structured_array_buffer_views(data, buffer, target, offset=None, na
     key = "verticies"
     buffer_view = gltf.BufferView(buffer, offset, length, stride, target, name=name.format(key=key))
     result[key] = buffer_view
-    print(result)
     return result
 
 
@@ -102,6 +127,262 @@ def byteLength(buffers):
         return sum(map(lambda buffer: buffer.nbytes, buffers))
 
 
+def index_dtype(count):
+    # 65535 is reserved as primitive restart value for UNSIGNED_SHORT indices
+    return np.uint16 if count < 65535 else np.uint32
+
+
+def weld_vertices(vertex_data, index_data, fields=None, tolerance=None):
+    """Merge coincident vertices of a structured vertex array and rewrite the indices.
+
+    Vertices are considered equal when every field listed in ``fields`` matches
+    (all fields by default). With ``tolerance`` positions are snapped to a grid of
+    that size before comparing, every other field must match bit for bit so colors,
+    normals and attribute values are never merged across different values. Fields that are not part of the key are averaged
+    over the merged vertices, normals are renormalized afterwards.
+    Vertex order follows the first occurrence of every welded vertex.
+    """
+    fields = vertex_data.dtype.names if fields is None else tuple(fields)
+    count = len(vertex_data)
+    if count == 0:
+        return vertex_data, np.asarray(index_data, dtype=index_dtype(0))
+
+    columns = []
+    for field in fields:
+        values = np.ascontiguousarray(vertex_data[field]).reshape(count, -1)
+        if values.dtype.kind == "f":
+            if tolerance and field == "position":
+                values = np.floor(values / tolerance + 0.5).astype(np.int64)
+            else:
+                # adding zero turns -0.0 into 0.0 so both get the same bit pattern
+                values = (values + 0).view(np.dtype(f"i{values.itemsize}")).astype(np.int64)
+        columns.append(values.astype(np.int64))
+    keys = np.concatenate(columns, axis=1)
+
+    order = np.lexsort(keys.T[::-1])
+    sorted_keys = keys[order]
+    is_first = np.empty(count, dtype=bool)
+    is_first[0] = True
+    np.any(sorted_keys[1:] != sorted_keys[:-1], axis=1, out=is_first[1:])
+    group = np.cumsum(is_first) - 1
+
+    # lexsort is stable, so the head of every group is its first occurrence
+    first = order[is_first]
+    group_order = np.argsort(first, kind="stable")
+    new_index = np.empty_like(group_order)
+    new_index[group_order] = np.arange(len(group_order))
+    remap = np.empty(count, dtype=np.int64)
+    remap[order] = new_index[group]
+
+    welded = vertex_data[first[group_order]]
+    averaged = [name for name in vertex_data.dtype.names if name not in fields]
+    if averaged:
+        weights = np.bincount(remap, minlength=len(welded)).astype(np.float64)
+        for name in averaged:
+            values = vertex_data[name].reshape(count, -1).astype(np.float64)
+            sums = np.stack([np.bincount(remap, weights=column, minlength=len(welded)) for column in values.T], axis=1)
+            welded[name] = (sums / weights[:, None]).reshape(welded[name].shape)
+        if "normal" in averaged:
+            welded["normal"] = normalize_vectors(welded["normal"])
+
+    index_data = remap[np.asarray(index_data)].astype(index_dtype(len(welded)))
+    return welded, index_data
+
+
+def custom_attribute_name(name):
+    # "CU pct" -> "_CU_PCT"
+    return "_" + re.sub(r"[^0-9A-Za-z]+", "_", str(name)).strip("_").upper()
+
+
+def encode_custom_attribute(values, encoding="float32"):
+    """Encode attribute values for a custom vertex attribute, returns (array, accessor extras)
+
+    * float32 - values as they are
+    * float16 - half floats stored as UNSIGNED_SHORT bits, decode with unpackHalf in the shader
+    * uint16 - integer codes as they are, strings as indices into extras["categories"],
+      floats quantized to 0..65534 over extras min/max with 65535 as no data
+
+    extras carry the encoding and the value range so a viewer can restyle without the source data.
+    """
+    values = np.asarray(values)
+    if encoding not in CUSTOM_ATTRIBUTE_ENCODINGS:
+        raise ValueError(f"encoding must be one of {CUSTOM_ATTRIBUTE_ENCODINGS}")
+    extras = {"encoding": encoding}
+    if values.dtype.kind not in "biuf":
+        categories, codes = np.unique(values.astype(str), return_inverse=True)
+        extras.update({"categories": categories.tolist(), "min": 0, "max": len(categories) - 1})
+        if encoding != "uint16" or len(categories) > 65535:
+            raise ValueError("string attributes can only be exported as uint16 codes")
+        return codes.astype(np.uint16), extras
+
+    finite = values[np.isfinite(values)] if values.dtype.kind == "f" else values
+    low, high = (finite.min().item(), finite.max().item()) if len(finite) else (0, 0)
+    extras.update({"min": low, "max": high})
+    if encoding == "float32":
+        return values.astype(np.float32), extras
+    if encoding == "float16":
+        return values.astype(np.float16).view(np.uint16), extras
+    if values.dtype.kind in "biu":
+        if low < 0 or high > 65535:
+            raise ValueError("integer codes must fit into uint16")
+        return values.astype(np.uint16), extras
+    scale = 65534 / (high - low) if high > low else 0.0
+    with np.errstate(invalid="ignore"):
+        codes = np.rint((values - low) * scale)
+    extras["no_data"] = 65535
+    return np.where(np.isfinite(codes), codes, 65535).astype(np.uint16), extras
+
+
+def encode_custom_attributes(columns, encoding="float32"):
+    """Encode {attribute name: values}, returns ({field: array}, {field: accessor extras})"""
+    custom, extras = {}, {}
+    for attribute, values in columns.items():
+        name = custom_attribute_name(attribute)
+        custom[name], extras[name] = encode_custom_attribute(values, encoding)
+        extras[name]["attribute"] = attribute
+    return custom, extras
+
+
+def extend_vertex_data(vertex_data, columns, exclude=()):
+    """Copy of a structured vertex array with extra fields {name: values}, without the excluded fields
+
+    Every field starts on a multiple of 4 bytes and the stride is padded to one,
+    as glTF requires for vertex attribute offsets, even for 1 and 2 byte components.
+    """
+    names = [name for name in vertex_data.dtype.names if name not in exclude]
+    fields = [(name, vertex_data.dtype.fields[name][0]) for name in names]
+    fields += [(name, np.dtype((values.dtype, values.shape[1:]))) for name, values in columns.items()]
+    offsets, end = [], 0
+    for _, field_dtype in fields:
+        offsets.append(-(-end // 4) * 4)
+        end = offsets[-1] + field_dtype.itemsize
+    dtype = np.dtype({"names": [name for name, _ in fields], "formats": [field_dtype for _, field_dtype in fields],
+                      "offsets": offsets, "itemsize": -(-end // 4) * 4})
+    extended = np.zeros(len(vertex_data), dtype=dtype)
+    for name in names:
+        extended[name] = vertex_data[name]
+    for name, values in columns.items():
+        extended[name] = values
+    return extended
+
+
+def colormap_texels(gradient, size=256):
+    """Resample an N x 3 gradient (0-1 floats) to size RGB uint8 texels"""
+    gradient = np.asarray(gradient, dtype=np.float64)
+    position = np.linspace(0, len(gradient) - 1, size)
+    texels = np.stack([np.interp(position, np.arange(len(gradient)), channel) for channel in gradient.T], axis=1)
+    return np.rint(np.clip(texels, 0, 1) * 255).astype(np.uint8)
+
+
+def colormap_texcoords(values, limits, size=256):
+    """TEXCOORD_0 as normalized uint16 VEC2, u hits the texel centers of a size wide colormap
+
+    Values are clamped to limits, missing values take the first texel. The limits end up in
+    the texture coordinates, a different colormap image keeps them.
+    """
+    low, high = limits
+    scale = 1.0 / (high - low) if high > low else 0.0
+    with np.errstate(invalid="ignore"):
+        t = np.clip((np.asarray(values, dtype=np.float64) - low) * scale, 0, 1)
+    u = (0.5 + np.nan_to_num(t) * (size - 1)) / size
+    texcoords = np.empty((len(u), 2), dtype=np.uint16)
+    texcoords[:, 0] = np.rint(u * 65535)
+    texcoords[:, 1] = 32768
+    return texcoords
+
+
+def write_png(path, pixels):
+    """Minimal 8 bit RGB PNG writer for small generated textures, pixels is H x W x 3 uint8"""
+    pixels = np.asarray(pixels, dtype=np.uint8)
+    height, width = pixels.shape[:2]
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    # every scanline starts with filter type 0
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), pixels.reshape(height, -1)], axis=1)
+    with open(path, 'wb') as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw.tobytes())))
+        f.write(chunk(b"IEND", b""))
+
+
+def _primitives(document, mesh=None):
+    return [primitive for item in (document.meshes if mesh is None else [mesh]) for primitive in item.primitives]
+
+
+def add_colormap_material(document, image_uri, name="Colormap", mesh=None):
+    """Material sampling a 1D colormap image with TEXCOORD_0, assigned to every primitive of mesh or the document"""
+    image = gltf.Image(image_uri, mimeType="image/png", name=f"{name} Image")
+    sampler = gltf.Sampler(magFilter=gltf.Filter.LINEAR, minFilter=gltf.Filter.LINEAR,
+                           wrapS=gltf.Wrap.CLAMP_TO_EDGE, wrapT=gltf.Wrap.CLAMP_TO_EDGE, name=f"{name} Sampler")
+    texture = gltf.Texture(sampler, image, name=f"{name} Texture")
+    pbr = gltf.PBRMetallicRoughness(baseColorTexture=gltf.TextureInfo(texture), metallicFactor=0.0,
+                                    roughnessFactor=1.0)
+    material = gltf.Material(pbrMetallicRoughness=pbr, doubleSided=True, name=f"{name} Material")
+
+    document.add_image(image)
+    document.add_sampler(sampler)
+    document.add_texture(texture)
+    document.add_material(material)
+    for primitive in _primitives(document, mesh):
+        primitive.material = material
+    return material
+
+
+def save_colormap_texture(location, document, gradient, size=256, mesh=None):
+    """Write <location>_colormap.png next to the model and attach it to mesh or the whole document"""
+    png_path = f"{location}_colormap.png"
+    write_png(png_path, colormap_texels(gradient, size)[None])
+    name = "Colormap" if mesh is None else f"{mesh.name} Colormap"
+    return add_colormap_material(document, os.path.basename(png_path), name=name, mesh=mesh)
+
+
+def class_ranges(classes, per_item):
+    """(first index, count) range of every class that has items, with items already sorted by class
+
+    per_item is the number of indices of an item. Returns the ranges, for numpy_to_gltf
+    index_ranges, and the class of every range.
+    """
+    counts = np.bincount(classes)
+    present = np.flatnonzero(counts)
+    first = (np.cumsum(counts) - counts)[present] * per_item
+    return np.stack([first, counts[present] * per_item], axis=1), present
+
+
+def group_by_class(index_data, classes):
+    """Reorder the items of index_data (triangles, segments) so every class is contiguous
+
+    classes holds one class per item, index_data is split evenly between the items.
+    Returns the reordered index data followed by class_ranges.
+    """
+    classes = np.asarray(classes, dtype=np.int64)
+    order = np.argsort(classes, kind="stable")
+    per_item = len(index_data) // max(len(classes), 1)
+    grouped = index_data.reshape(len(classes), per_item)[order].ravel()
+    return (grouped, *class_ranges(classes, per_item))
+
+
+def add_class_materials(document, colors, names, mesh=None):
+    """One flat base color material per primitive of mesh or the document, in primitive order,
+    so classes toggle per primitive"""
+    materials = []
+    for primitive, color, name in zip(_primitives(document, mesh), colors, names):
+        pbr = gltf.PBRMetallicRoughness(baseColorFactor=[float(c) for c in color], metallicFactor=0.0,
+                                        roughnessFactor=1.0)
+        material = gltf.Material(pbrMetallicRoughness=pbr, doubleSided=True, name=str(name))
+        document.add_material(material)
+        primitive.material = material
+        materials.append(material)
+    return materials
+
+
+def normalize_vectors(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.array(vectors, dtype=np.float64), where=norms != 0)
+
+
 def normalize_vector(vector):
     norm = np.linalg.norm(vector)
     return vector / norm if norm != 0 else vector
@@ -142,36 +423,101 @@ def calculate_normals(vertices, indices):
     return normals
 
 
-def numpy_to_gltf(vertex_data, index_data, gltf_path, bin_path):
-    mesh = gltf.Mesh([], name="Default Mesh")
-    
-    document = gltf.Document.from_mesh(mesh)
-    buffers = [vertex_data, index_data]
-    buffer = gltf.Buffer(byteLength(buffers), uri=os.path.relpath(bin_path, os.path.dirname(gltf_path)), name="Default Buffer")
-    
+def numpy_to_gltf(vertex_data, index_data, gltf_path, bin_path, mode=gltf.PrimitiveMode.TRIANGLES, index_ranges=None,
+                  bounds=None, attribute_extras=None):
+    """Single mesh document with an interleaved vertex buffer followed by the index buffer
+
+    mode is a PrimitiveMode or its name. With index_ranges, a sequence of (first index, count)
+    pairs, one primitive is written per range, all sharing the vertex accessors; this is how
+    separate LINE_STRIP runs are stored since glTF has no primitive restart.
+    bounds, {field: (min, max)} as tracked by BufferBuilder, saves a pass over the vertices.
+    attribute_extras, {field: dict}, end up in the accessor extras (see encode_custom_attribute).
+    """
+    document = gltf.Document()
+    buffers = []
+    buffer = gltf.Buffer(0, uri=os.path.relpath(bin_path, os.path.dirname(gltf_path)), name="Default Buffer")
     document.add_buffer(buffer)
-    
-    offset = 0
+    mesh = add_mesh(document, buffer, buffers, vertex_data, index_data, mode, index_ranges, bounds, attribute_extras)
+    buffer.byteLength = byteLength(buffers)
+
+    node = gltf.Node(name="Default Node", mesh=mesh)
+    scene = gltf.Scene(name="Default Scene", nodes=[node])
+    document.add_node(node)
+    document.add_scene(scene)
+    document.scene = scene
+    return document, buffers
+
+
+def add_mesh(document, buffer, buffers, vertex_data, index_data, mode=gltf.PrimitiveMode.TRIANGLES, index_ranges=None,
+             bounds=None, attribute_extras=None, name="Default Mesh"):
+    """Append the vertex and index arrays to buffers, the arrays making up buffer, and a mesh reading them
+
+    The arrays are placed after the ones already in buffers, padded to 4 bytes, so several
+    meshes can share one binary buffer. Arguments as in numpy_to_gltf, the caller updates
+    buffer.byteLength once all meshes are added.
+    """
+    if isinstance(mode, str):
+        mode = gltf.PrimitiveMode[mode]
+    offset = byteLength(buffers) or 0
+    if padding(offset):
+        buffers.append(np.zeros(padding(offset), dtype=np.uint8))
+        offset += len(buffers[-1])
+    buffers.extend([vertex_data, index_data])
+    mesh = gltf.Mesh([], name=name)
+    document.add_mesh(mesh)
+
+    vertex_view = len(document.bufferViews)
     vertex_buffer_views = generate_structured_array_buffer_views(vertex_data, buffer, gltf.BufferTarget.ARRAY_BUFFER, offset=offset, name="{key} Buffer View")
     offset += vertex_data.nbytes
 
     index_buffer_view = generate_array_buffer_view(index_data, buffer, gltf.BufferTarget.ELEMENT_ARRAY_BUFFER, offset=offset, name="Index Buffer View")
     offset += index_data.nbytes
     
-    vertex_accessors = generate_structured_array_accessors(vertex_data, buffer_number=0, name="{key} Accessor")
-    index_accessor = generate_array_accessor(index_data, buffer_number=1, name="Index Accessor")
-    
-    primitive = gltf.Primitive(vertex_accessors, index_accessor, None, gltf.PrimitiveMode.TRIANGLES)
-    
+    vertex_accessors = generate_structured_array_accessors(vertex_data, buffer_number=vertex_view,
+                                                           name="{key} Accessor", bounds=bounds,
+                                                           extras=attribute_extras)
+    if index_ranges is None:
+        index_accessors = [generate_array_accessor(index_data, buffer_number=vertex_view + 1, name="Index Accessor")]
+    else:
+        _, componentType = from_np_type(index_data.dtype, ())
+        index_accessors = [gltf.Accessor(vertex_view + 1, int(first) * index_data.itemsize, int(count),
+                                         gltf.AccessorType.SCALAR, componentType, name=f"Index Accessor {number}")
+                           for number, (first, count) in enumerate(index_ranges)]
+
     document.add_buffer_views(vertex_buffer_views.values())
     document.add_buffer_view(index_buffer_view)
     
     document.add_accessors(vertex_accessors.values())
-    document.add_accessor(index_accessor)
-    
-    mesh.primitives.append(primitive)
-    
-    return document, buffers
+    document.add_accessors(index_accessors)
+
+    for index_accessor in index_accessors:
+        mesh.primitives.append(gltf.Primitive(vertex_accessors, index_accessor, None, mode))
+    return mesh
+
+
+def numpy_mesh_to_gltf(mesh_data, gltf_path, bin_path):
+    """numpy_to_gltf for a mesh data dict as returned by the handlers gltf_mesh_data"""
+    return numpy_to_gltf(mesh_data["vertex_data"], mesh_data["index_data"], gltf_path, bin_path,
+                         mesh_data.get("mode", gltf.PrimitiveMode.TRIANGLES), mesh_data.get("index_ranges"),
+                         mesh_data.get("bounds"), mesh_data.get("attribute_extras"))
+
+
+def add_mesh_materials(location, document, mesh_data, mesh=None):
+    """Materials a handler mesh data dict asks for: a colormap texture ("gradient") or one
+    material per class ("class_colors" and "class_names"), for mesh or every mesh"""
+    if "gradient" in mesh_data:
+        save_colormap_texture(location, document, mesh_data["gradient"], mesh=mesh)
+    if "class_colors" in mesh_data:
+        add_class_materials(document, mesh_data["class_colors"], mesh_data["class_names"], mesh=mesh)
+
+
+def as_bytes(array):
+    # flat uint8 view over the array memory, copies only non contiguous arrays
+    return np.ascontiguousarray(array).reshape(-1).view(np.uint8)
+
+
+def padding(length, boundary=4):
+    return -length % boundary
 
 
 def save(gltf_path, bin_path, document, buffers):
@@ -181,5 +527,424 @@ def save(gltf_path, bin_path, document, buffers):
 
     with open(bin_path, 'wb') as f:
         for buffer in buffers:
-            f.write(buffer.tobytes())
+            f.write(as_bytes(buffer))
+
+
+def save_glb(glb_path, document, buffers):
+    """Write the document and its single binary buffer as one .glb file
+
+    Layout: 12 byte header, JSON chunk padded with spaces, BIN chunk padded with zeros,
+    both to 4 bytes. Arrays are written straight from their memory.
+    """
+    data = document.togltf()
+    if len(data.get("buffers", [])) != 1:
+        raise ValueError("GLB export needs a document with exactly one buffer")
+    bin_length = sum(buffer.nbytes for buffer in buffers)
+    # the BIN chunk is referenced by the first buffer without uri
+    data["buffers"][0].pop("uri", None)
+    data["buffers"][0]["byteLength"] = bin_length
+
+    json_chunk = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    json_chunk += b" " * padding(len(json_chunk))
+    bin_padding = padding(bin_length)
+    total_length = 12 + 8 + len(json_chunk) + 8 + bin_length + bin_padding
+    if total_length > GLB_MAX_LENGTH:
+        raise ValueError(f"GLB files are limited to {GLB_MAX_LENGTH} bytes, got {total_length}")
+
+    with open(glb_path, 'wb') as f:
+        f.write(struct.pack("<4sII", GLB_MAGIC, GLB_VERSION, total_length))
+        f.write(struct.pack("<II", len(json_chunk), GLB_CHUNK_JSON))
+        f.write(json_chunk)
+        f.write(struct.pack("<II", bin_length + bin_padding, GLB_CHUNK_BIN))
+        for buffer in buffers:
+            f.write(as_bytes(buffer))
+        f.write(b"\0" * bin_padding)
+
+
+DTYPE_BY_COMPONENT_TYPE = {
+    5120: np.int8,
+    5121: np.uint8,
+    5122: np.int16,
+    5123: np.uint16,
+    5125: np.uint32,
+    5126: np.float32,
+}
+
+COMPONENTS_BY_ACCESSOR_TYPE = {
+    "SCALAR": (),
+    "VEC2": (2,),
+    "VEC3": (3,),
+    "VEC4": (4,),
+    "MAT2": (2, 2),
+    "MAT3": (3, 3),
+    "MAT4": (4, 4),
+}
+
+
+def _enum(enum, value):
+    return None if value is None else enum(value)
+
+
+def _component_type(value):
+    try:
+        return gltf.ComponentType(value)
+    except ValueError:
+        return gltf.ComponentType.custom(value)
+
+
+def _attribute(name):
+    try:
+        return gltf.Attribute(name)
+    except ValueError:
+        return gltf.Attribute.custom(name)
+
+
+def document_from_gltf(data):
+    """gltf2.Document from parsed glTF JSON, the inverse of Document.togltf
+
+    Cameras, animations and skins are not read, accessors keep their bufferView index
+    like the ones numpy_to_gltf creates.
+    """
+    def common(item):
+        return {key: item[key] for key in ("name", "extensions", "extras") if key in item}
+
+    document = gltf.Document(extensionsUsed=data.get("extensionsUsed", []),
+                             extensionsRequired=data.get("extensionsRequired", []))
+    document.asset = data.get("asset", document.asset)
+    buffers = [gltf.Buffer(item.get("byteLength", 0), item.get("uri"), **common(item))
+               for item in data.get("buffers", [])]
+    document.add_buffers(buffers)
+    views = [gltf.BufferView(buffers[item["buffer"]], item.get("byteOffset"), item["byteLength"],
+                             item.get("byteStride"), _enum(gltf.BufferTarget, item.get("target")), **common(item))
+             for item in data.get("bufferViews", [])]
+    document.add_buffer_views(views)
+
+    for item in data.get("accessors", []):
+        sparse = item.get("sparse")
+        if sparse is not None:
+            indices, values = sparse["indices"], sparse["values"]
+            sparse = gltf.AccessorSparse(
+                sparse["count"],
+                gltf.AccessorSparseIndices(views[indices["bufferView"]], indices.get("byteOffset"),
+                                           _component_type(indices["componentType"])),
+                gltf.AccessorSparseValues(views[values["bufferView"]], values.get("byteOffset")))
+        accessor = gltf.Accessor(item.get("bufferView"), item.get("byteOffset"), item["count"],
+                                 gltf.AccessorType(item["type"]), _component_type(item["componentType"]),
+                                 min=item.get("min"), max=item.get("max"), sparse=sparse, **common(item))
+        accessor.normalized = item.get("normalized", False)
+        document.add_accessor(accessor)
+    accessors = document.accessors
+
+    images = [gltf.Image(item.get("uri"), mimeType=item.get("mimeType"),
+                         bufferView=views[item["bufferView"]] if "bufferView" in item else None, **common(item))
+              for item in data.get("images", [])]
+    document.add_images(images)
+    samplers = [gltf.Sampler(magFilter=_enum(gltf.Filter, item.get("magFilter")),
+                             minFilter=_enum(gltf.Filter, item.get("minFilter")),
+                             wrapS=_enum(gltf.Wrap, item.get("wrapS")), wrapT=_enum(gltf.Wrap, item.get("wrapT")),
+                             **common(item))
+                for item in data.get("samplers", [])]
+    document.add_samplers(samplers)
+    textures = [gltf.Texture(samplers[item["sampler"]] if "sampler" in item else None,
+                             images[item["source"]] if "source" in item else None, **common(item))
+                for item in data.get("textures", [])]
+    document.add_textures(textures)
+
+    def texture_info(item):
+        if item is None:
+            return None
+        return gltf.TextureInfo(textures[item["index"]], texCoord=item.get("texCoord"), **common(item))
+
+    for item in data.get("materials", []):
+        pbr = item.get("pbrMetallicRoughness")
+        if pbr is not None:
+            pbr = gltf.PBRMetallicRoughness(baseColorFactor=pbr.get("baseColorFactor"),
+                                            baseColorTexture=texture_info(pbr.get("baseColorTexture")),
+                                            metallicFactor=pbr.get("metallicFactor"),
+                                            roughnessFactor=pbr.get("roughnessFactor"),
+                                            metallicRoughnessTexture=texture_info(pbr.get("metallicRoughnessTexture")),
+                                            extensions=pbr.get("extensions"), extras=pbr.get("extras"))
+        document.add_material(gltf.Material(
+            pbrMetallicRoughness=pbr, normalTexture=texture_info(item.get("normalTexture")),
+            occlusionTexture=texture_info(item.get("occlusionTexture")),
+            emissiveTexture=texture_info(item.get("emissiveTexture")), emissiveFactor=item.get("emissiveFactor"),
+            alphaMode=_enum(gltf.AlphaMode, item.get("alphaMode")), alphaCutoff=item.get("alphaCutoff"),
+            doubleSided=item.get("doubleSided"), **common(item)))
+
+    for item in data.get("meshes", []):
+        primitives = [gltf.Primitive({_attribute(name): accessors[key] for name, key in primitive["attributes"].items()},
+                                     accessors[primitive["indices"]] if "indices" in primitive else None,
+                                     document.materials[primitive["material"]] if "material" in primitive else None,
+                                     gltf.PrimitiveMode(primitive.get("mode", 4)), targets=primitive.get("targets"),
+                                     extensions=primitive.get("extensions"), extras=primitive.get("extras"))
+                      for primitive in item["primitives"]]
+        document.add_mesh(gltf.Mesh(primitives, weights=item.get("weights"), **common(item)))
+
+    nodes = [gltf.Node(mesh=document.meshes[item["mesh"]] if "mesh" in item else None,
+                       **{key: item[key] for key in ("matrix", "rotation", "scale", "translation", "weights")
+                          if key in item}, **common(item))
+             for item in data.get("nodes", [])]
+    for node, item in zip(nodes, data.get("nodes", [])):
+        node.children = [nodes[child] for child in item.get("children", [])]
+    document.add_nodes(nodes)
+    document.add_scenes([gltf.Scene(nodes=[nodes[node] for node in item.get("nodes", [])], **common(item))
+                         for item in data.get("scenes", [])])
+    if document.scenes:
+        document.scene = document.scenes[data.get("scene", 0)]
+    return document
+
+
+def load(path, mode="r"):
+    """Read a .gltf (with its .bin files) or .glb file into a document and its buffers
+
+    Buffers are np.memmap uint8 arrays over the files (data URIs are decoded in memory),
+    so nothing is read until an accessor_array is used. mode is the memmap mode,
+    "r+" or "c" give writable views. Returns (document, buffers) like numpy_to_gltf.
+    """
+    with open(path, "rb") as f:
+        header = f.read(12)
+    if header[:4] == GLB_MAGIC:
+        return _load_glb(path, mode)
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    document = document_from_gltf(data)
+    return document, [_load_buffer(os.path.dirname(path), buffer, mode) for buffer in document.buffers]
+
+
+def _load_buffer(directory, buffer, mode):
+    if buffer.uri is None:
+        raise ValueError(f"Buffer {buffer.key} has no uri")
+    if buffer.uri.startswith("data:"):
+        return np.frombuffer(base64.b64decode(buffer.uri.split(",", 1)[1]), dtype=np.uint8)[:buffer.byteLength]
+    if buffer.byteLength == 0:
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(os.path.join(directory, unquote(buffer.uri)), dtype=np.uint8, mode=mode,
+                     shape=(buffer.byteLength,))
+
+
+def _load_glb(path, mode):
+    with open(path, "rb") as f:
+        magic, version, length = struct.unpack("<4sII", f.read(12))
+        if version != GLB_VERSION:
+            raise ValueError(f"Unsupported GLB version {version}")
+        json_length, chunk_type = struct.unpack("<II", f.read(8))
+        if chunk_type != GLB_CHUNK_JSON:
+            raise ValueError("GLB file does not start with a JSON chunk")
+        data = json.loads(f.read(json_length))
+        bin_chunk = f.read(8)
+    document = document_from_gltf(data)
+    buffers = []
+    for buffer in document.buffers:
+        if buffer.uri is None and not buffers and len(bin_chunk) == 8:
+            bin_length, chunk_type = struct.unpack("<II", bin_chunk)
+            if chunk_type != GLB_CHUNK_BIN:
+                raise ValueError("GLB BIN chunk expected after the JSON chunk")
+            buffers.append(np.memmap(path, dtype=np.uint8, mode=mode, offset=12 + 8 + json_length + 8,
+                                     shape=(buffer.byteLength,)))
+        else:
+            buffers.append(_load_buffer(os.path.dirname(path), buffer, mode))
+    return document, buffers
+
 
+def accessor_array(document, buffers, accessor):
+    """NumPy view of the accessor elements straight over the buffer memory
+
+    accessor is an Accessor or its index. Interleaved accessors become strided views,
+    no data is copied unless the accessor is sparse or has no bufferView.
+    """
+    if isinstance(accessor, int):
+        accessor = document.accessors[accessor]
+    dtype = np.dtype(DTYPE_BY_COMPONENT_TYPE[accessor.componentType.value])
+    shape = COMPONENTS_BY_ACCESSOR_TYPE[accessor.type.value]
+    if accessor.bufferView is None:
+        array = np.zeros((accessor.count, *shape), dtype=dtype)
+    else:
+        view = document.bufferViews[accessor.bufferView]
+        element_size = dtype.itemsize * int(np.prod(shape))
+        stride = view.byteStride or element_size
+        offset = (view.byteOffset or 0) + (accessor.byteOffset or 0)
+        if accessor.count and offset + stride * (accessor.count - 1) + element_size > \
+                (view.byteOffset or 0) + view.byteLength:
+            raise ValueError(f"Accessor {accessor.key} runs past its buffer view")
+        component_strides = tuple(np.cumprod((dtype.itemsize, *shape[:0:-1]))[::-1]) if shape else ()
+        # column padding of small matrices is not handled
+        array = np.ndarray((accessor.count, *shape), dtype=dtype, buffer=buffers[view.buffer.key],
+                           offset=offset, strides=(stride, *component_strides))
+    if accessor.sparse is not None:
+        array = array.copy()
+        sparse = accessor.sparse
+        indices = _sparse_array(buffers, sparse.indices, sparse.count,
+                                DTYPE_BY_COMPONENT_TYPE[sparse.indices.componentType.value])
+        values = _sparse_array(buffers, sparse.values, sparse.count * int(np.prod(shape)), dtype)
+        array[indices] = values.reshape((sparse.count, *shape))
+    return array
+
+
+def _sparse_array(buffers, part, count, dtype):
+    # sparse indices and values are tightly packed in their buffer view
+    view = part.bufferView
+    return np.ndarray((count,), dtype=dtype, buffer=buffers[view.buffer.key],
+                      offset=(view.byteOffset or 0) + (part.byteOffset or 0))
+
+
+def sparse_index_dtype(count):
+    if count <= 0xFF:
+        return np.uint8
+    return np.uint16 if count <= 0xFFFF else np.uint32
+
+
+def save_sparse_update(base_path, location, changes):
+    """Write <location>.gltf and <location>.bin, a copy of a .gltf export with a few vertex values changed
+
+    changes maps attribute names (COLOR_0, _HIDDEN, ...) to (vertex indices, new values).
+    The base buffers are referenced, not copied: changed attributes become sparse accessors
+    over the original buffer views and only the indices and values go to <location>.bin.
+    Attributes missing from the base are added as zero-initialized sparse accessors.
+    base_path must be a full export, not an earlier update. Without any changed vertex
+    nothing is written and None is returned, glTF sparse accessors need at least one value.
+    """
+    if not any(len(indices) for indices, _ in changes.values()):
+        return None
+    document, _ = load(base_path)
+    if base_path.endswith(".glb") or any(buffer.uri is None for buffer in document.buffers):
+        raise ValueError("Sparse updates need a .gltf base with external buffers")
+    if any(accessor.sparse is not None for accessor in document.accessors):
+        raise ValueError("Sparse updates are written against a full export, not an earlier update")
+    gltf_path = f"{location}.gltf"
+    bin_path = f"{location}.bin"
+    directory = os.path.dirname(os.path.abspath(gltf_path))
+    for buffer in document.buffers:
+        if not buffer.uri.startswith("data:"):
+            path = os.path.join(os.path.dirname(os.path.abspath(base_path)), unquote(buffer.uri))
+            buffer.uri = os.path.relpath(path, directory).replace(os.sep, "/")
+
+    delta = gltf.Buffer(0, uri=os.path.basename(bin_path), name="Update Buffer")
+    arrays = []
+    primitives = [primitive for mesh in document.meshes for primitive in mesh.primitives]
+    for name, (indices, values) in changes.items():
+        attribute = _attribute(name)
+        base = next((primitive.attributes[attribute] for primitive in primitives
+                     if attribute in primitive.attributes), None)
+        indices = np.asarray(indices, dtype=np.int64)
+        values = np.asarray(values)
+        # sparse indices must be strictly increasing
+        indices, unique = np.unique(indices, return_index=True)
+        values = values[unique]
+        if len(indices) == 0:
+            continue
+        if base is None:
+            if values.dtype == np.float64:
+                values = values.astype(np.float32)
+            count = primitives[0].attributes[gltf.Attribute.POSITION].count
+            accessor_type, component_type = from_np_type(values.dtype, values.shape[1:])
+            accessor = gltf.Accessor(None, None, count, accessor_type, component_type, name=f"{name} Accessor")
+        else:
+            accessor = gltf.Accessor(base.bufferView, base.byteOffset, base.count, base.type, base.componentType,
+                                     name=base.name, extras=base.extras)
+            accessor.normalized = base.normalized
+            values = values.astype(DTYPE_BY_COMPONENT_TYPE[base.componentType.value])
+        indices = indices.astype(sparse_index_dtype(accessor.count - 1))
+
+        sparse_views = []
+        for array in (indices, values):
+            offset = sum(len(item) for item in arrays)
+            arrays.append(np.zeros(padding(offset), dtype=np.uint8))
+            sparse_views.append(gltf.BufferView(delta, offset + len(arrays[-1]), array.nbytes, None, None,
+                                                name=f"{name} Sparse Buffer View"))
+            arrays.append(as_bytes(array))
+        document.add_buffer_views(sparse_views)
+        accessor.sparse = gltf.AccessorSparse(len(indices),
+                                              gltf.AccessorSparseIndices(sparse_views[0], None,
+                                                                         COMPONENT_TYPE_BY_DTYPE[indices.dtype.type]),
+                                              gltf.AccessorSparseValues(sparse_views[1]))
+        document.add_accessor(accessor)
+        for primitive in primitives:
+            primitive.attributes[attribute] = accessor
+
+    delta.byteLength = sum(len(item) for item in arrays)
+    if delta.byteLength:
+        document.add_buffer(delta)
+    save(gltf_path, bin_path, document, arrays)
+    return document
+
+
+class BufferBuilder:
+    """Vertex and index buffers filled chunk by chunk without a final concatenation
+
+    With known counts both arrays are allocated once, otherwise they grow by doubling.
+    Given a path the arrays are memory-mapped scratch files (<path>.vertices.tmp and
+    <path>.indices.tmp), so only the chunk being appended has to fit in memory.
+    Chunk indices are local to the chunk and get shifted by the vertices already
+    stored. Min/max of every vertex field are tracked while appending.
+    """
+    initial_capacity = 1024
+
+    def __init__(self, vertex_dtype, vertex_count=None, index_count=None, index_type=None, path=None):
+        self.vertex_dtype = np.dtype(vertex_dtype)
+        if index_type is None:
+            index_type = np.uint32 if vertex_count is None else index_dtype(vertex_count)
+        self.index_type = np.dtype(index_type)
+        self.path = path
+        self.vertex_count = 0
+        self.index_count = 0
+        self.bounds = {}
+        self._vertices = self._allocate("vertices", self.vertex_dtype, vertex_count or self.initial_capacity)
+        self._indices = self._allocate("indices", self.index_type, index_count or self.initial_capacity)
+
+    def _allocate(self, name, dtype, capacity, previous=None):
+        if self.path is None:
+            array = np.empty(capacity, dtype=dtype)
+            if previous is not None:
+                array[:len(previous)] = previous
+            return array
+        filename = f"{self.path}.{name}.tmp"
+        if previous is not None:
+            previous.flush()
+        # extending the file keeps the data already written, no copy needed
+        with open(filename, "r+b" if previous is not None else "wb") as f:
+            f.truncate(capacity * dtype.itemsize)
+        return np.memmap(filename, dtype=dtype, mode="r+", shape=(capacity,))
+
+    def _reserve(self, vertex_count, index_count):
+        if self.vertex_count + vertex_count > len(self._vertices):
+            capacity = max(self.vertex_count + vertex_count, 2 * len(self._vertices))
+            self._vertices = self._allocate("vertices", self.vertex_dtype, capacity, self._vertices)
+        if self.index_count + index_count > len(self._indices):
+            capacity = max(self.index_count + index_count, 2 * len(self._indices))
+            self._indices = self._allocate("indices", self.index_type, capacity, self._indices)
+
+    def append(self, vertex_chunk, index_chunk):
+        vertex_count, index_count = len(vertex_chunk), len(index_chunk)
+        if self.vertex_count + vertex_count > np.iinfo(self.index_type).max:
+            raise ValueError(f"{self.index_type} indices cannot address {self.vertex_count + vertex_count} vertices")
+        self._reserve(vertex_count, index_count)
+
+        self._vertices[self.vertex_count:self.vertex_count + vertex_count] = vertex_chunk
+        self._indices[self.index_count:self.index_count + index_count] = np.asarray(index_chunk, dtype=np.int64) + \
+            self.vertex_count
+        for name in self.vertex_dtype.names:
+            if vertex_count and vertex_chunk[name].dtype.kind in "iuf":
+                low, high = np.amin(vertex_chunk[name], axis=0), np.amax(vertex_chunk[name], axis=0)
+                if name in self.bounds:
+                    low, high = np.minimum(self.bounds[name][0], low), np.maximum(self.bounds[name][1], high)
+                self.bounds[name] = (low, high)
+        self.vertex_count += vertex_count
+        self.index_count += index_count
+
+    @property
+    def vertex_data(self):
+        return self._vertices[:self.vertex_count]
+
+    @property
+    def index_data(self):
+        return self._indices[:self.index_count]
+
+    def close(self):
+        """Drop the scratch files of a path backed builder"""
+        if self.path is None:
+            return
+        self._vertices = self._indices = None
+        for name in ("vertices", "indices"):
+            filename = f"{self.path}.{name}.tmp"
+            if os.path.exists(filename):
+                os.remove(filename)